@@ -0,0 +1,50 @@
+"""Serial invoke vs concurrent batch greeting generation against a fake slow chat model.
+
+Run from email-sms/:  python benchmarks/bench_campaign.py [users] [latency_seconds] [max_concurrency]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import ai, campaign
+from fake_chat_model import SlowFakeChatModel
+
+
+def fake_users(count):
+    return [(i, f"User {i}", f"user{i}@example.com", "", "2000-01-01", "Texas", 0) for i in range(count)]
+
+
+async def run_async(chain, users, concurrency):
+    return [item async for item in campaign.agenerate_greetings(chain, users, "Diwali", max_concurrency=concurrency)]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    users = fake_users(count)
+    chain = ai.get_greeting_chain(SlowFakeChatModel(latency=latency))
+
+    start = time.perf_counter()
+    for user in users[: min(count, 20)]:
+        chain.invoke({"name": user[1], "occasion": "Diwali"})
+    serial = (time.perf_counter() - start) / min(count, 20) * count
+    print(f"serial invoke     ~{serial:.1f}s for {count} users (extrapolated from 20)")
+
+    start = time.perf_counter()
+    first = None
+    for _ in campaign.generate_greetings(chain, users, "Diwali", max_concurrency=concurrency):
+        first = first or time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    print(f"batch_as_completed {elapsed:.1f}s for {count} users (concurrency={concurrency}, first result {first:.2f}s)")
+
+    start = time.perf_counter()
+    asyncio.run(run_async(chain, users, concurrency))
+    print(f"abatch_as_completed {time.perf_counter() - start:.1f}s for {count} users")
+
+    model = SlowFakeChatModel(latency=latency)
+    start = time.perf_counter()
+    list(campaign.generate_from_template(ai.get_greeting_template_chain(model), users, "Diwali", "Texas"))
+    print(f"template mode      {time.perf_counter() - start:.1f}s for {count} users ({model.calls} LLM call)")
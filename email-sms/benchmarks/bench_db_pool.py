@@ -0,0 +1,60 @@
+"""Connect-per-call vs pooled SQLite access (ops/sec).
+
+Run from email-sms/:  python benchmarks/bench_db_pool.py [ops]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import db_pool
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, email TEXT, phone TEXT, birthday TEXT, area TEXT, dnc INTEGER DEFAULT 0
+)
+"""
+
+
+def op_connect_per_call(path, i):
+    # What every helper in db.py / user_manage.py / festive_manage.py did before.
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (name, email, area) VALUES (?, ?, ?)", (f"u{i}", f"u{i}@x.com", "Texas"))
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(path)
+    conn.execute("SELECT * FROM users WHERE area=?", ("Texas",)).fetchone()
+    conn.close()
+
+
+def op_pooled(path, i):
+    conn = db_pool.get_connection(path)
+    with conn:
+        conn.execute("INSERT INTO users (name, email, area) VALUES (?, ?, ?)", (f"u{i}", f"u{i}@x.com", "Texas"))
+    conn.execute("SELECT * FROM users WHERE area=?", ("Texas",)).fetchone()
+
+
+def run(label, op, ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.execute(SCHEMA)
+        conn.close()
+        start = time.perf_counter()
+        for i in range(ops):
+            op(path, i)
+        elapsed = time.perf_counter() - start
+        db_pool.close_connection(path)
+    print(f"{label:<20} {ops / elapsed:>10.0f} ops/sec  ({ops} ops in {elapsed:.2f}s)")
+    return ops / elapsed
+
+
+if __name__ == "__main__":
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before = run("connect-per-call", op_connect_per_call, ops)
+    after = run("pooled (WAL)", op_pooled, ops)
+    print(f"speedup: {after / before:.1f}x")
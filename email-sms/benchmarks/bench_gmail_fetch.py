@@ -0,0 +1,94 @@
+"""Serial vs batched fetch of unread messages against the local fake Gmail server.
+
+Besides timing both paths it checks that they store the same messages, that a
+single-page fetch stops after one page, that transient 503s are retried and that
+messages failing every retry raise BatchFetchError with the rest kept; exits 1
+if any check fails.
+
+Run from email-sms/:  python benchmarks/bench_gmail_fetch.py [count] [latency_seconds]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import db, gmail
+from fake_gmail_server import FakeGmailServer
+
+
+def fetch_serial(service, page_size):
+    # The previous implementation: one messages().get round trip per message.
+    emails = []
+    for messages in gmail.list_unread_pages(service, page_size=page_size):
+        for msg in messages:
+            detail = service.users().messages().get(
+                userId='me', id=msg['id'], format='metadata', metadataHeaders=gmail.METADATA_HEADERS
+            ).execute()
+            emails.append(gmail.email_from_detail(detail))
+    db.save_emails_to_db(emails)
+    return emails
+
+
+def stored_ids():
+    return {row[0] for row in db.get_conn().execute("SELECT id FROM emails")}
+
+
+def check_failures(server, service):
+    """List of problems with batch retries against 503ing messages; empty when they behave."""
+    problems = []
+    ids = sorted(server.mailbox.messages)[:10]
+    server.mailbox.failures = {ids[0]: 1}
+    details = gmail.get_messages_batched(service, ids, retries=1)
+    if [d["id"] for d in details] != ids:
+        problems.append("a transient 503 was not retried")
+    server.mailbox.failures = {ids[1]: float("inf"), ids[2]: float("inf")}
+    try:
+        gmail.get_messages_batched(service, ids, retries=1)
+        problems.append("messages failing every retry did not raise BatchFetchError")
+    except gmail.BatchFetchError as e:
+        if sorted(e.failed_ids) != ids[1:3]:
+            problems.append(f"BatchFetchError.failed_ids is {sorted(e.failed_ids)}, expected {ids[1:3]}")
+        if sorted(d["id"] for d in e.details) != ids[:1] + ids[3:]:
+            problems.append("BatchFetchError.details doesn't hold the messages that were fetched")
+    server.mailbox.failures = {}
+    return problems
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    server = FakeGmailServer(message_count=count, latency=latency).start()
+    gmail.GMAIL_BATCH_URI = server.batch_uri
+    problems, stored = [], {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, run in (
+                ("serial", lambda svc: fetch_serial(svc, 100)),
+                ("batched", lambda svc: gmail.fetch_unread_emails(max_results=100, all_pages=True, service=svc)),
+                ("one page", lambda svc: gmail.fetch_unread_emails(max_results=100, service=svc)),
+            ):
+                db.DB_PATH = os.path.join(tmp, f"{label}.db")
+                db.init_db()
+                service = server.service()
+                server.mailbox.requests = 0
+                start = time.perf_counter()
+                emails = run(service)
+                elapsed = time.perf_counter() - start
+                stored[label] = stored_ids()
+                print(f"{label:<8} {len(emails)} messages in {elapsed:.2f}s, {server.mailbox.requests} API calls")
+
+            if stored["serial"] != set(server.mailbox.messages):
+                problems.append(f"serial stored {len(stored['serial'])} of {count} messages")
+            if stored["batched"] != stored["serial"]:
+                problems.append(f"batched stored {len(stored['batched'])} messages, serial {len(stored['serial'])}")
+            if len(stored["one page"]) != min(count, 100):
+                problems.append(f"single-page fetch stored {len(stored['one page'])} messages, expected {min(count, 100)}")
+            problems += check_failures(server, server.service())
+    finally:
+        server.stop()
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print("batched == serial, pagination and BatchFetchError OK")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,42 @@
+"""Time to first usable field: blocking greeting_parser chain vs ai.stream_greeting.
+
+The fake model streams its response over `latency` seconds, like a remote model
+writing a long HTML card. The same stream through llm_router's RoutingChatModel
+should look no different: the router passes chunks on as they arrive.
+
+Run from email-sms/:  python benchmarks/bench_greeting_stream.py [latency_seconds]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import ai, llm_router
+from fake_chat_model import SlowFakeChatModel
+
+INPUTS = {"name": "Émilie", "occasion": "Diwali"}
+
+if __name__ == "__main__":
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    llm = SlowFakeChatModel(latency=latency)
+
+    start = time.perf_counter()
+    ai.get_greeting_chain(llm).invoke(INPUTS)
+    blocking = time.perf_counter() - start
+    print(f"parser chain:     every field after {blocking:.2f}s")
+
+    first_field = {}
+    for label, model in (
+        ("stream_greeting", llm),
+        ("via llm_router", llm_router.RoutingChatModel(local=SlowFakeChatModel(latency=latency), remote=llm)),
+    ):
+        start = time.perf_counter()
+        for field, value in ai.stream_greeting(ai.get_greeting_stream_chain(model), INPUTS):
+            elapsed = time.perf_counter() - start
+            first_field.setdefault(label, elapsed)
+            print(f"{label + ':':<18}{field:<9} after {elapsed:.2f}s")
+
+    late = [label for label, elapsed in first_field.items() if elapsed > blocking / 2]
+    if late:
+        print("FAIL: first field not streamed early: " + ", ".join(late))
+    sys.exit(1 if late else 0)
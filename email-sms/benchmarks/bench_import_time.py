@@ -0,0 +1,67 @@
+"""Cold-start import profile of main.py using `python -X importtime`.
+
+Runs only main.py's top-level import statements in a fresh interpreter (best of
+several runs), prints the slowest top-level imports and fails if the total goes
+over the budget or a heavy client library is loaded before any page needs it.
+
+Run from email-sms/:  python benchmarks/bench_import_time.py [budget_ms]
+"""
+import ast
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(APP_DIR, "main.py")
+RUNS = 3
+# Streamlit itself accounts for most of this; the app's own modules should add little.
+DEFAULT_BUDGET_MS = 2500
+# Loaded on demand by the pages/workers that use them, never at cold start.
+LAZY_PACKAGES = (
+    "googleapiclient", "google_auth_oauthlib", "langchain_openai", "langchain_ollama", "langchain", "flask", "tomlkit",
+    "pandas",
+)
+
+
+def main_imports():
+    tree = ast.parse(open(MAIN, encoding="utf-8").read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def profile(code):
+    """Return {top-level module: cumulative µs} and the set of every module imported."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=APP_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr.strip().splitlines()[-1])
+    top_level, loaded = {}, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip())
+        if not name[1:].startswith(" "):  # nested imports are indented under their parent
+            top_level[name.strip()] = int(cumulative)
+    return top_level, loaded
+
+
+if __name__ == "__main__":
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+    code = main_imports()
+    runs = [profile(code) for _ in range(RUNS)]
+    top_level, loaded = min(runs, key=lambda run: sum(run[0].values()))
+    total_ms = sum(top_level.values()) / 1000
+
+    print("main.py imports:\n  " + code.replace("\n", "\n  "))
+    print("\nslowest top-level imports:")
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+    print(f"\ncold start imports: {total_ms:.0f} ms (best of {RUNS}, budget {budget_ms:.0f} ms)")
+
+    eager = sorted({name.split(".")[0] for name in loaded} & set(LAZY_PACKAGES))
+    if eager:
+        print("FAIL: loaded at cold start: " + ", ".join(eager))
+    if total_ms > budget_ms:
+        print("FAIL: over budget")
+    sys.exit(1 if eager or total_ms > budget_ms else 0)
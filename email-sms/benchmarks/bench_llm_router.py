@@ -0,0 +1,160 @@
+"""llm_router against a stub Ollama server, with a slow fake model standing in for OpenAI.
+
+Runs a concurrent mix of short replies (routed locally), long replies and
+greetings (routed to the remote model), then the same mix with the local model
+writing prose instead of JSON and with the server down, and finally short
+replies one at a time while the local server fails every chat request.
+Prints where calls went and the per-backend latency histograms (cumulative),
+checks each phase's routing, escalation, circuit breaker and the local
+concurrency limit, and exits 1 if any check fails.
+
+Run from email-sms/:  python benchmarks/bench_llm_router.py [calls]
+"""
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from modules import ai, llm_router
+from fake_chat_model import GREETING_JSON, SlowFakeChatModel
+from fake_ollama_server import FakeOllamaServer
+
+REPLY_JSON = json.dumps({"reply": "Thanks, I'll take a look today.", "subject": "Re: Question"})
+SHORT = {"subject": "Question", "body": "Could you send me the opening hours?"}
+LONG = {"subject": "Contract", "body": "Please review the attached terms. " * 100}
+
+
+class FakeOpenAI(SlowFakeChatModel):
+    """The remote stand-in: answers greeting prompts with a greeting, anything else with a reply."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        response = GREETING_JSON if "greeting" in messages[-1].content else REPLY_JSON
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+
+def workload(llm, calls):
+    """Run the mix concurrently; returns how many calls raised."""
+    reply_chain, greeting_chain = ai.get_email_reply_chain(llm), ai.get_greeting_chain(llm)
+    jobs = [(reply_chain, SHORT)] * short_count(calls) + [(reply_chain, LONG)] * (calls // 8)
+    jobs += [(greeting_chain, {"name": "Ann", "occasion": "Diwali"})] * (calls - len(jobs))
+
+    def run(job):
+        try:
+            job[0].invoke(job[1])
+            return 0
+        except Exception:
+            return 1
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        return sum(pool.map(run, jobs))
+
+
+def short_count(calls):
+    return calls * 3 // 4
+
+
+def sequential(llm, calls):
+    """`calls` short replies one after the other; returns how many raised."""
+    reply_chain, errors = ai.get_email_reply_chain(llm), 0
+    for _ in range(calls):
+        try:
+            reply_chain.invoke(SHORT)
+        except Exception:
+            errors += 1
+    return errors
+
+
+def report(label, elapsed, before):
+    """Print the phase's calls per backend; returns {backend: calls/failures/busy during the phase}."""
+    print(f"\n{label} ({elapsed:.1f}s)")
+    deltas = {}
+    for name, stats in llm_router.stats().items():
+        delta = {key: stats[key] - before.get(name, {}).get(key, 0) for key in ("calls", "failures", "busy")}
+        deltas[name] = dict(delta, down=stats["down"])
+        latency = stats["latency"]
+        buckets = " ".join(f"≤{bound}s:{n}" for bound, n in latency["buckets"].items() if n)
+        print(f"  {name:<7} {delta['calls']:4} calls  {delta['failures']} failed  {delta['busy']} busy  "
+              f"{'DOWN ' if stats['down'] else ''}p50≤{latency['p50']}s p95≤{latency['p95']}s  [{buckets}]")
+    return deltas
+
+
+def healthy_checks(calls, errors, local, remote):
+    # Every short reply tries the local model; only a full queue sends one on.
+    return [
+        ("no call failed", errors == 0),
+        ("short replies routed locally", local["calls"] + local["busy"] == short_count(calls)),
+        ("long replies and greetings routed remotely", remote["calls"] == calls - short_count(calls) + local["busy"]),
+        ("local model didn't fail", local["failures"] == 0),
+    ]
+
+
+def breaker_checks(calls, errors, local, remote):
+    threshold = llm_router.FAILURE_THRESHOLD
+    return [
+        ("no call failed", errors == 0),
+        (f"local model taken out after {threshold} failures", local["failures"] == local["calls"] == threshold),
+        ("local backend reported down", local["down"]),
+        ("every reply answered remotely", remote["calls"] == calls),
+    ]
+
+
+def prose_checks(calls, errors, local, remote):
+    # Each prose answer costs one remote call (a fix-up, or the escalated call itself).
+    return [
+        ("no call failed", errors == 0),
+        ("every call ended at the remote model", remote["calls"] == calls),
+    ]
+
+
+def down_checks(calls, errors, local, remote):
+    return [
+        ("no call failed", errors == 0),
+        ("nothing sent to the local server", local["calls"] == 0),
+        ("every call answered remotely", remote["calls"] == calls),
+    ]
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    server = FakeOllamaServer(response=REPLY_JSON, latency=0.05).start()
+    llm_router.HEALTH_TTL_SECONDS = 0.5
+    llm = llm_router.with_local_model(FakeOpenAI(latency=1.0), base_url=server.base_url)
+    breaker_calls = llm_router.FAILURE_THRESHOLD + 2
+
+    def fail_chat():
+        server.down, server.fail_chat = False, True
+
+    failed = []
+    for label, setup, run, phase_calls, checks in (
+        ("healthy local model", lambda: None, workload, calls, healthy_checks),
+        ("local model writes prose (escalated via fix-up)", lambda: setattr(server, "response", "Sure! Happy to help."),
+         workload, calls, prose_checks),
+        ("local server down (health check fails)", lambda: setattr(server, "down", True), workload, calls, down_checks),
+        # Last: the tripped breaker keeps the local model out for COOLDOWN_SECONDS.
+        ("local chat requests fail (circuit breaker)", fail_chat, sequential, breaker_calls, breaker_checks),
+    ):
+        setup()
+        # Let the cached health result expire and re-check it now, so no call races the check.
+        time.sleep(llm_router.HEALTH_TTL_SECONDS)
+        llm_router.backend("ollama").healthy()
+        before = llm_router.stats()
+        start = time.perf_counter()
+        errors = run(llm, phase_calls)
+        deltas = report(label, time.perf_counter() - start, before)
+        for check, ok in checks(phase_calls, errors, deltas["ollama"], deltas["openai"]):
+            if not ok:
+                failed.append(f"{label}: {check}")
+
+    limit = llm_router.MAX_CONCURRENCY["ollama"]
+    print(f"\nmost concurrent requests at the local server: {server.max_in_flight} (limit {limit})")
+    if server.max_in_flight > limit:
+        failed.append("local concurrency limit exceeded")
+    server.stop()
+    for check in failed:
+        print(f"FAIL: {check}")
+    sys.exit(1 if failed else 0)
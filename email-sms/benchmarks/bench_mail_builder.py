@@ -0,0 +1,88 @@
+"""Build 10k greeting messages: per-send file read + MIMEMultipart vs cached template + mail_builder.
+
+Also checks that line breaks in To/Subject (CSV imports, LLM output) can't inject
+headers and that a non-ASCII display name in To keeps its address, and exits
+non-zero if either fails.
+
+Run from email-sms/:  python benchmarks/bench_mail_builder.py [count]
+"""
+import base64
+import email
+import email.policy
+import os
+import sys
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import getaddresses
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import mail_builder
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modules", "greetings.html")
+BODY = "Dear Émilie,\n\nWishing you a joyful Diwali filled with light and happiness.\n\nBest regards,\nSam"
+
+
+def build_old(to, subject, body):
+    # What gmail.send_email did for every recipient
+    message = MIMEMultipart('alternative')
+    message['to'] = to
+    message['subject'] = subject
+    with open(TEMPLATE, 'r', encoding='utf-8') as f:
+        content = f.read()
+    message.attach(MIMEText(content, 'html'))
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+def headers(raw):
+    message = base64.urlsafe_b64decode(raw)
+    return message.split(b"\r\n\r\n", 1)[0].split(b"\r\n")
+
+
+def check_header_injection():
+    """List of problems; empty when newlines in header values are handled."""
+    problems = []
+    raw = mail_builder.build_raw_message("ann@example.com", "Hi\r\nBcc: evil@example.com", BODY)
+    lines = headers(raw)
+    if any(line.lower().startswith(b"bcc:") for line in lines):
+        problems.append("Subject with CRLF injected a Bcc header")
+    if b"Subject: Hi Bcc: evil@example.com" not in lines:
+        problems.append(f"Subject not folded onto one line: {lines}")
+    try:
+        mail_builder.build_raw_message("ann@example.com\nBcc: evil@example.com", "Hi", BODY)
+        problems.append("To with a newline was accepted")
+    except ValueError:
+        pass
+    return problems
+
+
+def check_address_encoding():
+    """List of problems; empty when a non-ASCII display name keeps its address readable."""
+    raw = mail_builder.build_raw_message("José Díaz <jose@example.com>", "Hi", BODY)
+    message = email.message_from_bytes(base64.urlsafe_b64decode(raw), policy=email.policy.default)
+    found = getaddresses([str(message["To"])])
+    if found != [("José Díaz", "jose@example.com")]:
+        return [f"To with a non-ASCII name parsed as {found}"]
+    return []
+
+
+def build_new(to, subject, body):
+    html = mail_builder.render_template(TEMPLATE, subject, body)
+    return mail_builder.build_raw_message(to, subject, body, html)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    for label, build in (("file + MIMEMultipart", build_old), ("mail_builder", build_new)):
+        start = time.perf_counter()
+        for i in range(count):
+            build(f"user{i}@example.com", "Happy Diwali, Émilie! 🎉", BODY)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<22} {count} messages in {elapsed:.2f}s ({count / elapsed:,.0f} msg/sec)")
+
+    problems = check_header_injection() + check_address_encoding()
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print("headers: CR/LF in Subject folded, in To rejected; non-ASCII To names keep their address")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,54 @@
+"""Outbox drain throughput with a fake sender that rate-limits some requests.
+
+Run from email-sms/:  python benchmarks/bench_outbox.py [messages] [rate_per_sec] [error_rate]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import db, outbox
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Resp", (), {"status": status})()
+
+
+def make_sender(error_rate):
+    def send(to, subject, body, html):
+        time.sleep(0.005)  # simulated API latency
+        if random.random() < error_rate:
+            raise FakeHttpError(429)
+        return {"id": f"sent-{to}"}
+    return send
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    outbox.BACKOFF_BASE_SECONDS = 0.05  # keep retries inside the benchmark window
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        for i in range(count):
+            outbox.enqueue("bench", f"user{i}@example.com", "Hello", "Body")
+        # Enqueueing the same campaign again is a no-op
+        assert not outbox.enqueue("bench", "user0@example.com", "Hello", "Body")
+
+        bucket = outbox.TokenBucket(rate, capacity=max(1, int(rate / 10)))
+        start = time.perf_counter()
+        totals = {"sent": 0, "retried": 0, "failed": 0}
+        while outbox.status_counts("bench").get("pending"):
+            stats = outbox.send_pending(send_fn=make_sender(error_rate), bucket=bucket)
+            for key in totals:
+                totals[key] += stats[key]
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        print(f"{totals['sent']} sent, {totals['retried']} retries, {totals['failed']} failed "
+              f"in {elapsed:.2f}s -> {totals['sent'] / elapsed:.1f} messages/sec (bucket rate {rate}/s)")
+        print("final status:", outbox.status_counts("bench"))
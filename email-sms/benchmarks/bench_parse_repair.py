@@ -0,0 +1,81 @@
+"""Parse-repair path over a corpus of malformed greeting/reply outputs.
+
+Each corpus entry is a realistic model failure (fences, trailing commas, single
+quotes, renamed keys, ...). Without repair every failure means the user asks
+again: a full generation at `latency`. With ai.RepairingOutputParser most are
+fixed locally and the rest cost one fix-up call.
+
+Run from email-sms/:  python benchmarks/bench_parse_repair.py [latency_seconds]
+"""
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.exceptions import OutputParserException
+from modules import ai
+from fake_chat_model import GREETING_JSON, SlowFakeChatModel
+
+GREETING = json.loads(GREETING_JSON)
+REPLY = {"reply": "Hi Ann,\n\nThanks for your email. I'll send the invoice today.\n\nBest,\nSam",
+         "subject": "Re: Invoice"}
+REPLY_JSON = json.dumps(REPLY)
+ROUNDS = 200
+
+
+def corpus():
+    """(kind, parser, fix-up response, model output) for each failure mode."""
+    g, r = ai.greeting_parser, ai.email_reply_parser
+    pretty = json.dumps(GREETING, indent=2)
+    yield "strict", g, GREETING_JSON, pretty
+    yield "fenced", g, GREETING_JSON, f"```json\n{pretty}\n```"
+    yield "preamble", g, GREETING_JSON, f"Sure! Here is the greeting:\n{pretty}\nLet me know if you need changes."
+    yield "trailing comma", g, GREETING_JSON, pretty[:-2] + ",\n}"
+    yield "single quotes", g, GREETING_JSON, repr(GREETING)
+    yield "single quotes", r, REPLY_JSON, repr(REPLY)
+    yield "raw newlines", r, REPLY_JSON, '{"reply": "%s", "subject": "Re: Invoice"}' % REPLY["reply"]
+    yield "camelCase keys", g, GREETING_JSON, json.dumps({"Subject": GREETING["subject"], "SMS": GREETING["sms"],
+                                                           "emailBody": GREETING["email"], "htmlCard": GREETING["html_card"]})
+    yield "wrapped", g, GREETING_JSON, json.dumps({"greeting": GREETING})
+    yield "list value", r, REPLY_JSON, json.dumps({"reply": REPLY["reply"].split("\n\n"), "subject": REPLY["subject"]})
+    yield "missing sms", g, GREETING_JSON, json.dumps({k: v for k, v in GREETING.items() if k != "sms"})
+    yield "generic keys", r, REPLY_JSON, json.dumps({"title": REPLY["subject"], "text": REPLY["reply"]})
+    yield "truncated", g, GREETING_JSON, GREETING_JSON[:len(GREETING_JSON) // 2]
+    yield "prose only", r, REPLY_JSON, "I'm sorry, I can't help with that email."
+
+
+if __name__ == "__main__":
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    print(f"{'case':<16}{'strict':>8}{'outcome':>10}{'µs/parse':>10}")
+    outcomes, strict_failures = Counter(), 0
+    for kind, parser, fixed, text in corpus():
+        try:
+            parser.parse(text)
+            strict = "ok"
+        except OutputParserException:
+            strict, strict_failures = "FAIL", strict_failures + 1
+        before = ai.repair_stats()
+        fixup_llm = SlowFakeChatModel(response=fixed, latency=0)
+        try:
+            ai.repairing(parser, fixup_llm).parse(text)
+        except OutputParserException:
+            pass
+        after = ai.repair_stats()
+        outcome = next(o for o in ("clean", "repaired", "fixup", "failed") if after[o] > before[o])
+        outcomes[outcome] += 1
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            try:
+                ai.repairing(parser).parse(text)
+            except OutputParserException:
+                pass
+        elapsed = (time.perf_counter() - start) / ROUNDS * 1e6
+        print(f"{kind:<16}{strict:>8}{outcome:>10}{elapsed:>10.0f}")
+
+    print(f"\n{strict_failures} of {sum(outcomes.values())} outputs fail the strict parser; with repair: "
+          f"{outcomes['repaired']} fixed locally, {outcomes['fixup']} needed a fix-up call")
+    print(f"LLM calls saved: {outcomes['repaired']} full regenerations "
+          f"(~{outcomes['repaired'] * latency:.0f}s at {latency:.1f}s each); "
+          f"fix-up calls send only the broken text instead of the full prompt")
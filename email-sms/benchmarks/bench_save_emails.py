@@ -0,0 +1,44 @@
+"""Bulk ingest of synthetic emails through db.save_emails_to_db.
+
+Run from email-sms/:  python benchmarks/bench_save_emails.py [count]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import db, db_pool
+
+
+def synthetic_emails(count, offset=0):
+    for i in range(offset, offset + count):
+        yield {
+            "id": f"msg{i:08d}",
+            "subject": f"Subject {i}",
+            "sender": f"sender{i % 500}@example.com",
+            "snippet": "Lorem ipsum dolor sit amet " * 3,
+            "body": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20,
+            "received_at": "2025-01-01 00:00:00",
+            "replied": False,
+            "reply": "",
+        }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+
+        start = time.perf_counter()
+        inserted = db.save_emails_to_db(synthetic_emails(count))
+        elapsed = time.perf_counter() - start
+        print(f"fresh ingest:    {inserted} rows in {elapsed:.2f}s ({inserted / elapsed:,.0f} rows/sec)")
+
+        # Half already stored: duplicates are skipped by ON CONFLICT DO NOTHING.
+        start = time.perf_counter()
+        inserted = db.save_emails_to_db(synthetic_emails(count, offset=count // 2))
+        elapsed = time.perf_counter() - start
+        print(f"overlap ingest:  {inserted} new of {count} in {elapsed:.2f}s ({count / elapsed:,.0f} rows/sec)")
+        db_pool.close_connection(db.DB_PATH)
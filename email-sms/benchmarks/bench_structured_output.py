@@ -0,0 +1,83 @@
+"""Input tokens and latency: schema-native structured output vs format-instruction prompts.
+
+Offline it compares what each mode sends for the greeting and reply chains: the
+parser-mode prompt embeds the JSON schema as text, the native prompt doesn't
+and the schema travels as a tool / response_format definition instead. With
+OPENAI_API_KEY set it also times real calls and reads token usage from the API.
+
+Run from email-sms/:  python benchmarks/bench_structured_output.py [calls_per_mode]
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.callbacks import get_usage_metadata_callback
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from modules import ai
+
+CHAINS = {
+    "greeting": (ai.greeting_prompt, ai.greeting_parser, {"name": "Émilie", "occasion": "Diwali"}),
+    "reply": (ai.email_reply_prompt, ai.email_reply_parser,
+              {"subject": "Invoice for March", "body": "Hi Sam, could you resend the March invoice? Thanks, Ann"}),
+}
+
+
+def token_counter(llm):
+    """llm.get_num_tokens, or a ~4 characters/token estimate when the tokenizer can't be loaded."""
+    try:
+        llm.get_num_tokens("warm-up")
+        return llm.get_num_tokens, ""
+    except Exception:
+        return lambda text: len(text) // 4, "~"
+
+
+def sent_text(prompt, parser, inputs, mode):
+    """Everything the request carries besides the model's own answer, as text."""
+    if mode == "parser":
+        return prompt.partial(format_instructions=ai.parser_instructions(parser)).format(**inputs)
+    schema = json.dumps(convert_to_openai_tool(parser.pydantic_object))
+    return prompt.partial(format_instructions="").format(**inputs) + schema
+
+
+def live(llm, chain_name, mode, calls):
+    prompt, parser, inputs = CHAINS[chain_name]
+    chain = ai.structured_chain(prompt, parser, llm, mode)
+    latencies = []
+    with get_usage_metadata_callback() as usage:
+        for _ in range(calls):
+            start = time.perf_counter()
+            chain.invoke(inputs)
+            latencies.append(time.perf_counter() - start)
+    totals = {"input_tokens": 0, "output_tokens": 0}
+    for model_usage in usage.usage_metadata.values():
+        for key in totals:
+            totals[key] += model_usage.get(key, 0)
+    return statistics.median(latencies), totals["input_tokens"] / calls, totals["output_tokens"] / calls
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    has_key = bool(os.environ.get("OPENAI_API_KEY"))
+    if not has_key:
+        os.environ["OPENAI_API_KEY"] = "offline"  # only to construct the client
+    llm = ai.get_llm(use_cache=False, route=False)
+    count, approx = token_counter(llm)
+    method = ai.structured_output_method(llm)
+    print(f"model {llm.model_name}: native method {method}")
+
+    print(f"\n{'chain':<10}{'parser mode':>14}{'native mode':>14}")
+    for name, (prompt, parser, inputs) in CHAINS.items():
+        tokens = {mode: count(sent_text(prompt, parser, inputs, mode)) for mode in ("parser", "native")}
+        print(f"{name:<10}{approx + str(tokens['parser']):>14}{approx + str(tokens['native']):>14}  input tokens")
+
+    if not has_key:
+        print("\nset OPENAI_API_KEY to time real calls")
+        sys.exit(0)
+    print(f"\n{'chain':<10}{'mode':<8}{'median s':>10}{'in tok':>9}{'out tok':>9}  ({calls} calls each)")
+    for name in CHAINS:
+        for mode in ("parser", "native"):
+            latency, tokens_in, tokens_out = live(llm, name, mode, calls)
+            print(f"{name:<10}{mode:<8}{latency:>10.2f}{tokens_in:>9.0f}{tokens_out:>9.0f}")
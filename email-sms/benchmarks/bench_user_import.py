@@ -0,0 +1,52 @@
+"""Import a synthetic users CSV through user_manage.import_users_from_csv, twice.
+
+About 1% of rows are invalid and 5% repeat an earlier address with different
+casing; the second pass shows a re-upload only updating rows.
+
+Run from email-sms/:  python benchmarks/bench_user_import.py [rows]
+"""
+import csv
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import db, user_manage
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "email", "phone", "birthday", "area", "dnc"])
+        for i in range(rows):
+            if i % 100 == 99:
+                email = f"broken{i}.example.com"
+            elif i % 20 == 19:
+                email = f" User{i - 19}@Example.com "
+            else:
+                email = f"user{i}@example.com"
+            writer.writerow([
+                f"User {i}", email, f"+1 555 {i % 10_000_000:07d}",
+                f"{1950 + i % 50}-{1 + i % 12:02d}-{1 + i % 28:02d}", f"Area {i % 40}", int(i % 50 == 0),
+            ])
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        path = os.path.join(tmp, "users.csv")
+        write_csv(path, rows)
+        print(f"{rows:,} rows, {os.path.getsize(path) / 1e6:.0f} MB CSV")
+
+        for label in ("first import", "re-import"):
+            start = time.perf_counter()
+            stats = user_manage.import_users_from_csv(path)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<13} {elapsed:6.2f}s ({rows / elapsed:,.0f} rows/sec): "
+                  f"{stats['inserted']:,} new, {stats['updated']:,} updated, {stats['rejected']:,} rejected")
+        # ru_maxrss is KiB on Linux
+        print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
@@ -0,0 +1,52 @@
+"""Chat model stand-in that sleeps like a remote API and returns canned content."""
+import asyncio
+import json
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+GREETING_JSON = json.dumps({
+    "subject": "Warm wishes for you!",
+    "sms": "Wishing you a wonderful celebration! - Sam",
+    "email": "Dear friend,\n\nWishing you a wonderful celebration.\n\nBest regards,\nSam",
+    "html_card": "<div style=\"padding:16px;border-radius:8px\"><h2>Warm wishes!</h2>"
+                 "<p>Wishing you a wonderful celebration.</p></div>" * 10,
+})
+
+
+class SlowFakeChatModel(BaseChatModel):
+    """Returns `response` after sleeping `latency` seconds; counts calls.
+
+    When streamed, the response arrives in `chunk_size`-character pieces spread
+    evenly over `latency`, like tokens from a remote model.
+    """
+
+    response: str = GREETING_JSON
+    latency: float = 0.5
+    chunk_size: int = 16
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "slow-fake-chat"
+
+    def _result(self):
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result()
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        pieces = [self.response[i:i + self.chunk_size] for i in range(0, len(self.response), self.chunk_size)]
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result()
@@ -0,0 +1,194 @@
+"""A tiny in-process stand-in for the Gmail REST API.
+
+Implements just enough for the fetch/sync code paths:
+  GET  /gmail/v1/users/me/messages            (q/labelIds ignored, pageToken pagination)
+  GET  /gmail/v1/users/me/messages/<id>
+  GET  /gmail/v1/users/me/profile
+  GET  /gmail/v1/users/me/history             (startHistoryId, pageToken)
+  POST /batch/gmail/v1                        (multipart/mixed batch of the GETs above)
+
+Every HTTP round trip sleeps `latency` seconds, so batching effects are visible.
+`mailbox.failures` maps a message id to how many of its GETs answer 503 first
+(float("inf") for always), to exercise retries.
+
+    server = FakeGmailServer(message_count=1000, latency=0.02).start()
+    service = server.service()
+    gmail.GMAIL_BATCH_URI = server.batch_uri
+"""
+import base64
+import email.parser
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeMailbox:
+    def __init__(self, message_count):
+        self.lock = threading.Lock()
+        self.history_id = 1000
+        self.messages = {}
+        self.history = []  # (history_id, message_id)
+        self.requests = 0
+        self.failures = {}
+        for _ in range(message_count):
+            self.add_message(record_history=False)
+
+    def add_message(self, record_history=True):
+        with self.lock:
+            self.history_id += 1
+            msg_id = f"{len(self.messages) + 1:016x}"
+            body = base64.urlsafe_b64encode(f"Body of message {msg_id}".encode()).decode()
+            self.messages[msg_id] = {
+                "id": msg_id,
+                "threadId": msg_id,
+                "labelIds": ["INBOX", "UNREAD"],
+                "snippet": f"Snippet {msg_id}",
+                "historyId": str(self.history_id),
+                "internalDate": str(1735689600000 + len(self.messages) * 1000),
+                "payload": {
+                    "mimeType": "text/plain",
+                    "headers": [
+                        {"name": "From", "value": f"sender{len(self.messages)}@example.com"},
+                        {"name": "Subject", "value": f"Subject {msg_id}"},
+                        {"name": "Date", "value": "Wed, 1 Jan 2025 00:00:00 +0000"},
+                    ],
+                    "body": {"data": body},
+                },
+            }
+            if record_history:
+                self.history.append((self.history_id, msg_id))
+            return msg_id
+
+    def handle(self, method, path, query):
+        """Return (status, json_body) for one API call."""
+        with self.lock:
+            self.requests += 1
+        parts = path.strip("/").split("/")
+        if parts[:4] != ["gmail", "v1", "users", "me"]:
+            return 404, {"error": {"code": 404, "message": "Not found"}}
+        rest = parts[4:]
+        if rest == ["messages"]:
+            ids = sorted(self.messages, reverse=True)
+            size = int(query.get("maxResults", ["100"])[0])
+            offset = int(query.get("pageToken", ["0"])[0])
+            page = ids[offset:offset + size]
+            result = {"messages": [{"id": i, "threadId": i} for i in page], "resultSizeEstimate": len(ids)}
+            if offset + size < len(ids):
+                result["nextPageToken"] = str(offset + size)
+            return 200, result
+        if len(rest) == 2 and rest[0] == "messages":
+            with self.lock:
+                remaining = self.failures.get(rest[1], 0)
+                if remaining:
+                    self.failures[rest[1]] = remaining - 1
+            if remaining:
+                return 503, {"error": {"code": 503, "message": "Backend Error"}}
+            msg = self.messages.get(rest[1])
+            if msg is None:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            return 200, msg
+        if rest == ["profile"]:
+            return 200, {"emailAddress": "me@example.com", "historyId": str(self.history_id)}
+        if rest == ["history"]:
+            start = int(query["startHistoryId"][0])
+            if start < 1000:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            changes = [
+                {"id": str(h), "messagesAdded": [{"message": {"id": m, "threadId": m, "labelIds": ["INBOX", "UNREAD"]}}]}
+                for h, m in self.history if h > start
+            ]
+            result = {"historyId": str(self.history_id)}
+            if changes:
+                result["history"] = changes
+            return 200, result
+        return 404, {"error": {"code": 404, "message": "Not found"}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        status, body = self.server.mailbox.handle("GET", url.path, parse_qs(url.query))
+        self._send(status, body)
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        length = int(self.headers.get("Content-Length", 0))
+        payload = self.rfile.read(length)
+        if not self.path.startswith("/batch/"):
+            return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+        content_type = self.headers["Content-Type"]
+        mime = email.parser.BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + payload)
+        boundary = uuid.uuid4().hex
+        out = []
+        for part in mime.get_payload():
+            request_line = part.get_payload().splitlines()[0]
+            method, target, _ = request_line.split(" ", 2)
+            url = urlsplit(target)
+            status, body = self.server.mailbox.handle(method, url.path, parse_qs(url.query))
+            data = json.dumps(body)
+            content_id = part["Content-ID"]
+            out.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n"
+                f"{data}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        self._send(200, "".join(out).encode(), f"multipart/mixed; boundary={boundary}")
+
+
+class FakeGmailServer:
+    def __init__(self, message_count=0, latency=0.0, host="127.0.0.1", port=0):
+        self.mailbox = FakeMailbox(message_count)
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.mailbox = self.mailbox
+        self.httpd.latency = latency
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def batch_uri(self):
+        return self.base_url + "batch/gmail/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def service(self):
+        """A googleapiclient Gmail service bound to this server (no credentials needed)."""
+        import httplib2
+        from googleapiclient.discovery import build
+        return build(
+            "gmail", "v1",
+            http=httplib2.Http(),
+            static_discovery=True,
+            client_options={"api_endpoint": self.base_url},
+        )
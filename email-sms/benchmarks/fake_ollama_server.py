@@ -0,0 +1,122 @@
+"""A tiny in-process stand-in for an Ollama server.
+
+Implements what ChatOllama and llm_router's health check use:
+  GET  /api/tags      models that are "pulled"
+  GET  /api/version
+  POST /api/chat      streamed (NDJSON) or single response; `format` (JSON schema) is honoured
+                      by answering with `response`, which should then be JSON
+
+Every chat request sleeps `latency` seconds. Set `down = True` to answer 503s,
+`fail_chat = True` to fail only chat requests (health checks still pass), and
+`response` to change what the model says. `max_in_flight` records the most
+concurrent chat requests seen, to check concurrency limits.
+
+    server = FakeOllamaServer(latency=0.05).start()
+    llm = ChatOllama(model="mistral", base_url=server.base_url)
+"""
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server.fake
+        if server.down:
+            return self._send(503, {"error": "service unavailable"})
+        if self.path == "/api/tags":
+            return self._send(200, {"models": [{"name": f"{m}:latest", "model": f"{m}:latest"} for m in server.models]})
+        if self.path == "/api/version":
+            return self._send(200, {"version": "0.0.0-fake"})
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        server = self.server.fake
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/api/chat":
+            return self._send(404, {"error": "not found"})
+        if server.down:
+            return self._send(503, {"error": "service unavailable"})
+        if server.fail_chat:
+            return self._send(500, {"error": "model runner has unexpectedly stopped"})
+        if request.get("model", "").split(":")[0] not in server.models:
+            return self._send(404, {"error": f"model '{request.get('model')}' not found"})
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency)
+            self._send(200, *server.chat_body(request))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 128  # the default of 5 drops connections under a concurrent load
+
+
+class FakeOllamaServer:
+    def __init__(self, models=("mistral",), response="Happy birthday!", latency=0.0, host="127.0.0.1", port=0):
+        self.models = set(models)
+        self.response = response
+        self.latency = latency
+        self.down = False
+        self.fail_chat = False
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.fake = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def chat_body(self, request):
+        """(body, content type) for a chat request: NDJSON chunks when streaming."""
+        model = request["model"]
+        created = datetime.now(timezone.utc).isoformat()
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in request.get("messages", []))
+        final = {
+            "model": model, "created_at": created, "message": {"role": "assistant", "content": ""},
+            "done": True, "done_reason": "stop", "prompt_eval_count": prompt_tokens,
+            "eval_count": len(self.response.split()),
+        }
+        if not request.get("stream", True):
+            final["message"]["content"] = self.response
+            return final, "application/json"
+        pieces = [self.response[i:i + 16] for i in range(0, len(self.response), 16)]
+        lines = [
+            {"model": model, "created_at": created, "message": {"role": "assistant", "content": piece}, "done": False}
+            for piece in pieces
+        ]
+        lines.append(final)
+        return "".join(json.dumps(line) + "\n" for line in lines).encode(), "application/x-ndjson"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
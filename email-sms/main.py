@@ -1,38 +1,53 @@
+import importlib
+import sys
+
 import streamlit as st
-from modules import greetings, auto_reply, db, gmail_watch, user_manage,festive_manage, manage_gmail
+from modules import resources
+
+# Page label -> (module, render function). Page modules are imported the first
+# time their page is opened, so a cold start only loads Streamlit and the DB layer.
+PAGES = {
+    "Greeting Workflow": ("modules.greetings", "greeting_workflow"),
+    "Auto-Reply": ("modules.auto_reply", "auto_reply_ui"),
+    "Email Logs": ("modules.db", "show_email_logs"),
+    "Manage Users": ("modules.user_manage", "user_manage_ui"),
+    "Manage Festivals": ("modules.festive_manage", "festive_manage_ui"),
+    # "Gmail Watch Setup": ("modules.gmail_watch", "streamlit_watch_ui"),
+    "Manage Gmail": ("modules.manage_gmail", "gmail_manage_ui"),
+}
 
 st.set_page_config(page_title="Unified Email AI App", layout="wide")
 st.sidebar.title("Navigation")
 
 # ...existing sidebar...
-page = st.sidebar.radio(
-    "Go to",
-    [
-        "Greeting Workflow",
-        "Auto-Reply",
-        "Email Logs",
-        "Manage Users",
-        "Manage Festivals",
-        # "Gmail Watch Setup",
-        "Manage Gmail"
-    ]
-)
-
-db.init_db()  # Ensure DB is ready
+page = st.sidebar.radio("Go to", list(PAGES))
 
-if page == "Greeting Workflow":
-    greetings.greeting_workflow()
-elif page == "Auto-Reply":
-    auto_reply.auto_reply_ui()
-elif page == "Email Logs":
-    db.show_email_logs()
-elif page == "Manage Users":
-    user_manage.user_manage_ui()
-elif page == "Manage Festivals":
-    festive_manage.festive_manage_ui()
-elif page == "Gmail Watch Setup":
-    gmail_watch.streamlit_watch_ui()
-elif page == "Manage Gmail":
-    manage_gmail.gmail_manage_ui()
+# Shared, process-wide resources (see modules/resources.py): the schema is set up
+# once, not on every rerun; each run only checks the background sync is alive.
+resources.database()
 
+# Only report the LLM cache once something in this process has used it.
+if "modules.llm_cache" in sys.modules:
+    cache_stats = sys.modules["modules.llm_cache"].get_cache().stats()
+    st.sidebar.caption(
+        f"LLM cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entries"
+    )
+if "modules.ai" in sys.modules:
+    repair_stats = sys.modules["modules.ai"].repair_stats()
+    if repair_stats["repaired"] or repair_stats["fixup"]:
+        st.sidebar.caption(
+            f"Parse repair: {repair_stats['llm_calls_saved']} LLM calls saved, "
+            f"{repair_stats['fixup']} fix-up calls, {repair_stats['failed']} failed"
+        )
+if "modules.llm_router" in sys.modules:
+    for name, backend_stats in sys.modules["modules.llm_router"].stats().items():
+        if backend_stats["calls"]:
+            latency = backend_stats["latency"]
+            st.sidebar.caption(
+                f"{name}: {backend_stats['calls']} calls, p50 ≤{latency['p50']}s / p95 ≤{latency['p95']}s, "
+                f"{backend_stats['failures']} failed" + (" (down)" if backend_stats["down"] else "")
+            )
 
+module_name, render = PAGES[page]
+getattr(importlib.import_module(module_name), render)()
@@ -1,17 +1,293 @@
+import html
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Optional
+import openai
 from langchain.prompts import PromptTemplate
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.output_parsers import BaseOutputParser, StrOutputParser
 from langchain_core.output_parsers.pydantic import PydanticOutputParser
+from langchain_core.runnables import RunnableLambda
 from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
+from modules import llm_cache
 
 # --- Pydantic Model for Greeting/Reply Output ---
+# Field order is the order the model writes them in: short fields first, so a
+# streamed response has subject and sms ready long before the HTML card.
 class GreetingOutput(BaseModel):
     subject: str = Field(description="Subject line for the email")
-    email: str = Field(description="Full email greeting message in plain text")
     sms: str = Field(description="Short SMS greeting message under 160 characters")
+    email: str = Field(description="Full email greeting message in plain text")
     html_card: str = Field(description="HTML card version of the greeting for email")
 
 greeting_parser = PydanticOutputParser(pydantic_object=GreetingOutput)
 
+# --- Parse repair: fix near-miss JSON locally instead of asking the model again ---
+# Most parse failures are cosmetic (code fences, trailing commas, single quotes,
+# renamed keys). Those are repaired here; only output that still can't be read
+# costs one short fix-up call with just the broken text, not the original prompt.
+_FENCE = re.compile(r"```[A-Za-z]*\s*(.*?)```", re.S)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERAL = re.compile(r"\b(True|False|None)\b")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Keys models use instead of ours, with separators and case removed. Only renames
+# that can't mean anything else: a bare "text" or "body" is left for the fix-up call.
+FIELD_ALIASES = {
+    "subjectline": "subject",
+    "smsmessage": "sms", "smstext": "sms",
+    "emailbody": "email", "emailmessage": "email",
+    "html": "html_card", "htmlemail": "html_card",
+    "replybody": "reply", "replytext": "reply",
+}
+
+_repair_lock = threading.Lock()
+_repair_counts = Counter()
+
+def _squash(key):
+    return re.sub(r"[^a-z0-9]", "", str(key).lower())
+
+def _fix_outside_strings(segment):
+    segment = _TRAILING_COMMA.sub(r"\1", segment)
+    return _PY_LITERAL.sub(lambda m: _PY_LITERALS[m.group()], segment)
+
+def _to_json(text):
+    """Rewrite JSON-ish text as JSON: single-quoted strings, trailing commas, Python literals."""
+    parts, start, i = [], 0, 0
+    while i < len(text):
+        quote = text[i]
+        if quote not in "'\"":
+            i += 1
+            continue
+        parts.append(_fix_outside_strings(text[start:i]))
+        chars, i = [], i + 1
+        while i < len(text) and text[i] != quote:
+            c = text[i]
+            if c == "\\" and i + 1 < len(text):
+                chars.append("'" if text[i + 1] == "'" else c + text[i + 1])  # \' is not a JSON escape
+                i += 2
+                continue
+            chars.append('\\"' if c == '"' else c)
+            i += 1
+        parts.append('"' + "".join(chars) + '"')
+        i += 1
+        start = i
+    parts.append(_fix_outside_strings(text[start:]))
+    return "".join(parts)
+
+def _decode(text):
+    """The JSON object in a model response, and whether it decoded as-is (after fence stripping).
+
+    Otherwise it is cut out of any surrounding prose and JSON-ish syntax is rewritten.
+    """
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        data, exact = json.loads(text, strict=False), True
+    except ValueError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end < start:
+            raise ValueError("No JSON object in model output")
+        candidate = text[start:end + 1]
+        try:
+            data = json.loads(candidate, strict=False)
+        except ValueError:
+            data = json.loads(_to_json(candidate), strict=False)
+        exact = False
+    if not isinstance(data, dict):
+        raise ValueError("Model output is not a JSON object")
+    return data, exact
+
+def _as_text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_as_text(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def coerce_fields(data, model):
+    """Map a decoded object onto `model`: renamed/camelCase keys, a wrapping object, non-string values.
+
+    Nothing is made up: a missing required field raises ValueError like any other failed parse.
+    """
+    fields = model.model_fields
+    if len(data) == 1 and not data.keys() & fields.keys():
+        inner = next(iter(data.values()))
+        if isinstance(inner, dict):
+            data = inner  # {"greeting": {...}}
+    by_squashed = {_squash(name): name for name in fields}
+    values = {}
+    for key, value in data.items():
+        if value is None:
+            continue
+        squashed = _squash(key)
+        name = by_squashed.get(squashed) or FIELD_ALIASES.get(squashed)
+        if name in fields:
+            values.setdefault(name, _as_text(value))
+    return model.model_validate(values)
+
+def _repair(text, model):
+    data, exact = _decode(text)
+    if exact:
+        try:
+            return model.model_validate(data), False
+        except ValueError:
+            pass
+    return coerce_fields(data, model), True
+
+def repair(text, model):
+    """Parse `text` into `model` without an LLM call; raises ValueError if it can't be done."""
+    return _repair(text, model)[0]
+
+def _record(outcome):
+    with _repair_lock:
+        _repair_counts[outcome] += 1
+
+def repair_stats():
+    """Parse outcomes since start-up, one per parse; every local repair is one LLM call saved.
+
+    "fixup" counts parses a fix-up call rescued, "failed" those nothing could.
+    """
+    with _repair_lock:
+        counts = dict(_repair_counts)
+    for outcome in ("clean", "repaired", "fixup", "failed"):
+        counts.setdefault(outcome, 0)
+    counts["llm_calls_saved"] = counts["repaired"]
+    return counts
+
+fixup_prompt = PromptTemplate(
+    input_variables=["error", "completion", "format_instructions"],
+    template="""
+    The text below should be a JSON object but could not be parsed ({error}).
+    Return only the corrected JSON object, keeping every value's content unchanged.
+    {format_instructions}
+
+    Text:
+    {completion}
+    """
+)
+
+class RepairingOutputParser(BaseOutputParser):
+    """Drop-in for a PydanticOutputParser that repairs malformed output before failing.
+
+    Tries `repair` first (a plain json.loads for well-formed output), then the wrapped
+    parser; if both fail and `fixup_llm` is set, one fix-up call with only the broken
+    text and the schema, whose answer goes through `repair` too.
+    """
+
+    parser: PydanticOutputParser
+    fixup_llm: Optional[Any] = None
+
+    @property
+    def _type(self):
+        return "repairing_pydantic"
+
+    @property
+    def OutputType(self):
+        return self.parser.pydantic_object
+
+    def get_format_instructions(self):
+        return self.parser.get_format_instructions()
+
+    def parse(self, text):
+        model = self.parser.pydantic_object
+        try:
+            result, repaired = _repair(text, model)
+        except ValueError:
+            pass
+        else:
+            _record("repaired" if repaired else "clean")
+            return result
+        try:
+            result = self.parser.parse(text)  # LangChain's own leniency, e.g. for cut-off JSON
+        except OutputParserException as error:
+            strict_error = error
+        else:
+            _record("clean")
+            return result
+        if self.fixup_llm is None:
+            _record("failed")
+            raise strict_error
+        fixed = (fixup_prompt | self.fixup_llm | StrOutputParser()).invoke({
+            "error": str(strict_error).splitlines()[0],
+            "completion": text,
+            "format_instructions": self.get_format_instructions(),
+        })
+        try:
+            result = repair(fixed, model)
+        except ValueError as error:
+            _record("failed")
+            raise OutputParserException(f"Could not repair model output: {error}", llm_output=text) from error
+        _record("fixup")
+        return result
+
+def repairing(parser, fixup_llm=None):
+    return RepairingOutputParser(parser=parser, fixup_llm=fixup_llm)
+
+# --- Output modes: schema-native structured output, or format instructions + parser ---
+# "native" sends the schema as a tool / response_format (OpenAI enforces it, and
+# the prompt carries no schema text); "parser" puts the JSON schema in the prompt
+# and parses the text reply; "auto" uses native where the model has it and falls
+# back to the parser chain, per call, if a native call is rejected or unparseable.
+OUTPUT_MODES = ("auto", "native", "parser")
+DEFAULT_OUTPUT_MODE = "auto"
+# OpenAI models that accept response_format json_schema; others use function calling.
+JSON_SCHEMA_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+NATIVE_FALLBACK_ERRORS = (OutputParserException, ValueError, NotImplementedError, openai.BadRequestError)
+
+STRICT_JSON_NOTE = "Ensure the output is strict JSON (no trailing commas, use double quotes, no comments)."
+
+def parser_instructions(parser):
+    """What parser mode appends to a prompt: the JSON schema and a strict-JSON reminder."""
+    return f"{parser.get_format_instructions()}\n{STRICT_JSON_NOTE}"
+
+def structured_output_method(llm):
+    """with_structured_output method for `llm`, or None if the model has no native support."""
+    model_type = type(llm)
+    if model_type.with_structured_output is BaseChatModel.with_structured_output and model_type.bind_tools is BaseChatModel.bind_tools:
+        return None
+    model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or ""
+    return "json_schema" if str(model_name).startswith(JSON_SCHEMA_MODEL_PREFIXES) else "function_calling"
+
+def _require_output(result):
+    if result is None:
+        raise OutputParserException("Model returned no structured output")
+    return result
+
+def for_task(llm, task):
+    """Tag `llm` with a task hint if it routes between models (see llm_router); otherwise `llm`."""
+    return llm.for_task(task) if hasattr(llm, "for_task") else llm
+
+def structured_chain(prompt, parser, llm, mode=DEFAULT_OUTPUT_MODE, task=None):
+    """prompt -> llm -> `parser.pydantic_object`, in the given output mode (see OUTPUT_MODES)."""
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode {mode!r}")
+    fixup_llm = for_task(llm, "fixup")
+    llm = for_task(llm, task)
+    parser_chain = prompt.partial(format_instructions=parser_instructions(parser)) | llm | repairing(parser, fixup_llm)
+    method = None if mode == "parser" else structured_output_method(llm)
+    if method is None:
+        if mode == "native":
+            raise ValueError(f"{type(llm).__name__} has no native structured output")
+        return parser_chain
+    try:
+        structured_llm = llm.with_structured_output(parser.pydantic_object, method=method)
+    except NotImplementedError:
+        if mode == "native":
+            raise
+        return parser_chain  # e.g. a router with a backend that has no native support
+    native_chain = prompt.partial(format_instructions="") | structured_llm | RunnableLambda(_require_output)
+    if mode == "native":
+        return native_chain
+    return native_chain.with_fallbacks([parser_chain], exceptions_to_handle=NATIVE_FALLBACK_ERRORS)
+
 # --- Prompt Template for Greetings ---
 greeting_prompt = PromptTemplate(
     input_variables=["name", "occasion", "format_instructions"],
@@ -19,16 +295,142 @@ greeting_prompt = PromptTemplate(
     Create a professional and friendly {occasion} greeting for {name} suitable for sending via email and SMS.
 
     - Generate a subject line for the email.
-    - Write a full email greeting message in plain text.
     - Write a short SMS greeting message (under 160 characters).
+    - Write a full email greeting message in plain text.
     - Write an HTML card version of the greeting (with a nice layout, suitable for email, using inline CSS, and including the sender "sam haque, commartial landers ltd! 123 Main Street New York, NY 10001 USA" at the bottom).
     {format_instructions}
-    Ensure the output is strict JSON (no trailing commas, use double quotes, no comments).
     """
 )
 # --- LLM Chain for Greetings ---
-def get_greeting_chain(llm):
-    return greeting_prompt.partial(format_instructions=greeting_parser.get_format_instructions()) | llm | greeting_parser
+def get_greeting_chain(llm, mode=DEFAULT_OUTPUT_MODE):
+    return structured_chain(greeting_prompt, greeting_parser, llm, mode, task="greeting")
+
+# --- Streaming: fields become usable as soon as they are complete ---
+def get_greeting_stream_chain(llm):
+    """Like get_greeting_chain, but streams raw text for `stream_greeting`."""
+    return greeting_prompt.partial(format_instructions=parser_instructions(greeting_parser)) | for_task(llm, "greeting") | StrOutputParser()
+
+class StreamingJSONFields:
+    """Incremental scanner for a streamed JSON object.
+
+    `feed(text)` returns the top-level (field, value) pairs completed by that chunk.
+    Text before the opening brace (code fences, preambles) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = "key"  # key -> colon -> value -> comma -> key ...
+        self._key = None
+        self._token_start = None
+        self._value_start = None
+
+    def _complete(self, end):
+        raw = self.buffer[self._value_start:end]
+        self._value_start = None
+        self._expect = "comma"
+        try:
+            return [(self._key, json.loads(raw))]
+        except ValueError:
+            return []  # left for the full parse at the end to report
+
+    def feed(self, text):
+        self.buffer += text
+        done = []
+        for i in range(self._pos, len(self.buffer)):
+            c = self.buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key":
+                        self._key = json.loads(self.buffer[self._token_start:i + 1])
+                        self._expect = "colon"
+                    elif self._depth == 1 and self._expect == "value":
+                        done += self._complete(i + 1)
+            elif c == '"':
+                if self._depth == 0:
+                    continue  # quotes in a preamble
+                self._in_string = True
+                if self._depth == 1 and self._expect == "key":
+                    self._token_start = i
+                elif self._depth == 1 and self._expect == "value":
+                    self._value_start = i
+            elif c in "{[":
+                if self._depth == 0 and c == "[":
+                    continue
+                self._depth += 1
+                if self._depth == 2 and self._expect == "value":
+                    self._value_start = i
+            elif c in "}]":
+                if self._depth == 0:
+                    continue
+                if self._depth == 1 and self._value_start is not None:
+                    done += self._complete(i)  # number/true/false/null closed by the brace
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    done += self._complete(i + 1)
+            elif self._depth == 1:
+                if c == ":":
+                    self._expect = "value"
+                elif c == ",":
+                    if self._value_start is not None:
+                        done += self._complete(i)
+                    self._expect = "key"
+                elif not c.isspace() and self._expect == "value" and self._value_start is None:
+                    self._value_start = i
+        self._pos = len(self.buffer)
+        return done
+
+def stream_greeting(stream_chain, inputs, fixup_llm=None):
+    """Yield (field, value) for each GreetingOutput field as soon as it is complete.
+
+    The last item is ("result", GreetingOutput), parsed from the full text like the
+    non-streaming chain (repaired locally, then one fix-up call to `fixup_llm` if given).
+    """
+    scanner = StreamingJSONFields()
+    for chunk in stream_chain.stream(inputs):
+        yield from scanner.feed(chunk)
+    if fixup_llm is not None:
+        fixup_llm = for_task(fixup_llm, "fixup")
+    yield "result", repairing(greeting_parser, fixup_llm).parse(scanner.buffer)
+
+# --- Template-then-personalize: one LLM call per (occasion, area) ---
+# The model writes this literal token wherever the recipient's name goes; it is
+# filled in locally per user. Square brackets avoid clashing with prompt/CSS braces.
+NAME_PLACEHOLDER = "[[NAME]]"
+
+greeting_template_prompt = PromptTemplate(
+    input_variables=["occasion", "area", "format_instructions"],
+    template="""
+    Create a professional and friendly {occasion} greeting template for our customers in {area}, suitable for sending via email and SMS.
+    Wherever the recipient's name belongs, write exactly [[NAME]] (it will be replaced with each person's name).
+
+    - Generate a subject line for the email.
+    - Write a full email greeting message in plain text.
+    - Write a short SMS greeting message (under 140 characters, excluding the name).
+    - Write an HTML card version of the greeting (with a nice layout, suitable for email, using inline CSS, and including the sender "sam haque, commartial landers ltd! 123 Main Street New York, NY 10001 USA" at the bottom).
+    {format_instructions}
+    """
+)
+
+def get_greeting_template_chain(llm, mode=DEFAULT_OUTPUT_MODE):
+    return structured_chain(greeting_template_prompt, greeting_parser, llm, mode, task="greeting")
+
+def render_greeting(template, name):
+    """Fill a GreetingOutput template for one recipient without calling the LLM."""
+    return GreetingOutput(
+        subject=template.subject.replace(NAME_PLACEHOLDER, name),
+        email=template.email.replace(NAME_PLACEHOLDER, name),
+        sms=template.sms.replace(NAME_PLACEHOLDER, name),
+        html_card=template.html_card.replace(NAME_PLACEHOLDER, html.escape(name)),
+    )
 
 class EmailReplyOutput(BaseModel):
     reply: str = Field(description="A professional reply to the email")
@@ -49,13 +451,11 @@ Body:
 {body}
 
 {format_instructions}
-
-Ensure the output is a strict JSON object matching the structure.
 """
 )
 
-def get_email_reply_chain(llm):
-    return email_reply_prompt.partial(format_instructions=email_reply_parser.get_format_instructions()) | llm | email_reply_parser
+def get_email_reply_chain(llm, mode=DEFAULT_OUTPUT_MODE):
+    return structured_chain(email_reply_prompt, email_reply_parser, llm, mode)
 
 def generate_ai_reply(llm, subject, body):
     return get_email_reply_chain(llm).invoke({
@@ -64,6 +464,16 @@ def generate_ai_reply(llm, subject, body):
     })
 
 # --- Example LLM loader ---
-def get_llm():
+# With routing on, short tasks are answered by a local Ollama model when one is
+# running (see llm_router); set LLM_ROUTING=off to always use OpenAI.
+ROUTE_TO_LOCAL = os.environ.get("LLM_ROUTING", "on").lower() != "off"
+
+def get_llm(rate_limiter=None, use_cache=True, route=ROUTE_TO_LOCAL):
     # Customize with your OpenAI API key as needed
-    return ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7)
\ No newline at end of file
+    # Identical (prompt, model, params) calls are answered from the persistent cache in llm_cache.db
+    cache = llm_cache.get_cache() if use_cache else None
+    openai_llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7, rate_limiter=rate_limiter, cache=cache)
+    if not route:
+        return openai_llm
+    from modules import llm_router
+    return llm_router.with_local_model(openai_llm, cache=cache)
\ No newline at end of file
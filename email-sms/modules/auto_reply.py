@@ -1,5 +1,5 @@
 import streamlit as st
-from modules import db, g, ai
+from modules import db, resources
 from streamlit_autorefresh import st_autorefresh
 def auto_reply_ui():
 
@@ -14,6 +14,7 @@ def auto_reply_ui():
 
     # st.write(f"Refreshed {st.session_state.refresh_count} times.")
     st.header("Gmail Auto-Reply")
+    db.sync_status()
 
     # st.markdown("This page automatically refreshes every 5 seconds to check for new emails.")
 
@@ -38,8 +39,7 @@ def auto_reply_ui():
             if not replied:
                 if st.button("🤖 Generate AI Reply", key=f"auto_reply_{email_id}"):
                     with st.spinner("Generating AI reply..."):
-                        llm = ai.get_llm()
-                        ai_reply = ai.generate_ai_reply(llm, subject, snippet)
+                        ai_reply = resources.reply_chain().invoke({"subject": subject, "body": snippet})
                         st.subheader("🤖 AI Reply")
                         st.write(ai_reply)
                         db.update_reply_in_db(email_id, ai_reply)
@@ -0,0 +1,73 @@
+# Parallel LLM calls per campaign; OpenAI rate limits, not CPU, are the bound here.
+DEFAULT_MAX_CONCURRENCY = 8
+# Requests/sec allowed towards the LLM provider across the whole campaign.
+DEFAULT_REQUESTS_PER_SECOND = 5
+
+
+def make_rate_limiter(requests_per_second=DEFAULT_REQUESTS_PER_SECOND):
+    """Token-bucket limiter to pass to `ai.get_llm(rate_limiter=...)`."""
+    from langchain_core.rate_limiters import InMemoryRateLimiter
+    return InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        check_every_n_seconds=0.05,
+        max_bucket_size=max(1, int(requests_per_second)),
+    )
+
+
+def _inputs(users, occasion):
+    # users are rows from `SELECT * FROM users`: (id, name, email, phone, birthday, area, dnc, ...)
+    return [{"name": user[1], "occasion": occasion} for user in users]
+
+
+def generate_greetings(greeting_chain, users, occasion, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Run `greeting_chain` for every user concurrently, yielding (user, result, error) as each finishes.
+
+    Results arrive in completion order, so a UI can render them immediately.
+    A failed user yields (user, None, exception) instead of aborting the campaign.
+    """
+    if not users:
+        return
+    outputs = greeting_chain.batch_as_completed(
+        _inputs(users, occasion),
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    for idx, output in outputs:
+        if isinstance(output, Exception):
+            yield users[idx], None, output
+        else:
+            yield users[idx], output, None
+
+
+async def agenerate_greetings(greeting_chain, users, occasion, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Async variant of `generate_greetings` built on `abatch_as_completed`."""
+    if not users:
+        return
+    outputs = greeting_chain.abatch_as_completed(
+        _inputs(users, occasion),
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    async for idx, output in outputs:
+        if isinstance(output, Exception):
+            yield users[idx], None, output
+        else:
+            yield users[idx], output, None
+
+
+def generate_from_template(template_chain, users, occasion, area):
+    """Template mode: one LLM call for the whole (occasion, area), then local rendering per user.
+
+    Yields (user, result, error) like `generate_greetings`, so callers can switch modes freely.
+    """
+    if not users:
+        return
+    from modules import ai
+    try:
+        template = template_chain.invoke({"occasion": occasion, "area": area})
+    except Exception as e:
+        for user in users:
+            yield user, None, e
+        return
+    for user in users:
+        yield user, ai.render_greeting(template, user[1] or ""), None
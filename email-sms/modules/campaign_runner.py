@@ -0,0 +1,200 @@
+import sys
+import time
+import traceback
+from datetime import date
+
+from modules import campaign, db, outbox, suppression
+
+CHUNK_SIZE = 50
+POLL_INTERVAL = 5.0
+
+
+def create_campaign(name, occasion, areas=None, personalize=False):
+    """Create a campaign and snapshot its recipients (users with DNC off) in one transaction.
+
+    `areas=None` targets every user. Returns the campaign id.
+    """
+    with db.get_conn() as conn:
+        cursor = conn.execute(
+            "INSERT INTO campaigns (name, occasion, area, personalize) VALUES (?, ?, ?, ?)",
+            (name, occasion, ", ".join(areas) if areas else "all regions", int(personalize))
+        )
+        campaign_id = cursor.lastrowid
+        query = (
+            "INSERT INTO campaign_recipients (campaign_id, user_id, name, email) "
+            "SELECT ?, id, name, email FROM users WHERE COALESCE(dnc, 0) = 0"
+        )
+        params = [campaign_id]
+        if areas:
+            query += f" AND area IN ({','.join('?' for _ in areas)})"
+            params += list(areas)
+        conn.execute(query, params)
+    return campaign_id
+
+
+def progress(campaign_id):
+    """Recipient counts by status, plus the total; cheap enough for the UI to poll."""
+    counts = dict(db.get_conn().execute(
+        "SELECT status, COUNT(*) FROM campaign_recipients WHERE campaign_id=? GROUP BY status",
+        (campaign_id,)
+    ).fetchall())
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+CAMPAIGN_COLUMNS = "id, name, occasion, area, personalize, status, created_at"
+
+
+def list_campaigns(limit=20):
+    cursor = db.get_conn().execute(f"SELECT {CAMPAIGN_COLUMNS} FROM campaigns ORDER BY id DESC LIMIT ?", (limit,))
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_campaign(campaign_id):
+    cursor = db.get_conn().execute(f"SELECT {CAMPAIGN_COLUMNS} FROM campaigns WHERE id=?", (campaign_id,))
+    row = cursor.fetchone()
+    return dict(zip([c[0] for c in cursor.description], row)) if row else None
+
+
+def resume_campaign(campaign_id):
+    """Put a failed or finished campaign back in the runner's queue, retrying failed recipients."""
+    with db.get_conn() as conn:
+        conn.execute(
+            "UPDATE campaign_recipients SET status='pending', error=NULL WHERE campaign_id=? AND status='failed'",
+            (campaign_id,)
+        )
+        conn.execute(
+            "UPDATE campaigns SET status='pending', updated_at=CURRENT_TIMESTAMP WHERE id=?", (campaign_id,)
+        )
+
+
+def schedule_festival_campaigns(day=None):
+    """Create one campaign per festival occurring on `day` (default today); returns the new ids.
+
+    Campaign names are `festival:<name>:<area>:<day>`, so calling this again the
+    same day creates nothing new.
+    """
+    day = day or date.today()
+    created = []
+    for festival in db.get_upcoming_festivals(days=1, start=day):
+        name = f"festival:{festival['name']}:{festival['area'] or 'all'}:{day.isoformat()}"
+        exists = db.get_conn().execute("SELECT 1 FROM campaigns WHERE name=?", (name,)).fetchone()
+        if not exists:
+            areas = [festival["area"]] if festival["area"] else None
+            created.append(create_campaign(name, festival["name"], areas))
+    return created
+
+
+def _set_status(campaign_id, status):
+    with db.get_conn() as conn:
+        conn.execute(
+            "UPDATE campaigns SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?", (status, campaign_id)
+        )
+
+
+def _template(campaign_id, llm, occasion, area):
+    # The template is checkpointed too, so a resumed campaign reuses the same wording.
+    from modules import ai
+    conn = db.get_conn()
+    stored = conn.execute("SELECT template FROM campaigns WHERE id=?", (campaign_id,)).fetchone()[0]
+    if stored:
+        return ai.GreetingOutput.model_validate_json(stored)
+    template = ai.get_greeting_template_chain(llm).invoke({"occasion": occasion, "area": area})
+    with conn:
+        conn.execute("UPDATE campaigns SET template=? WHERE id=?", (template.model_dump_json(), campaign_id))
+    return template
+
+
+def _next_chunk(campaign_id, size):
+    return db.get_conn().execute(
+        "SELECT user_id, name, email FROM campaign_recipients "
+        "WHERE campaign_id=? AND status='pending' ORDER BY user_id LIMIT ?",
+        (campaign_id, size)
+    ).fetchall()
+
+
+def run_campaign(campaign_id, llm=None, chunk_size=CHUNK_SIZE):
+    """Generate and queue greetings for every pending recipient, checkpointing after each chunk.
+
+    After a crash or restart it continues with the recipients still 'pending'. A recipient
+    queued just before a crash is re-processed, but the outbox's (campaign, recipient)
+    key keeps the email from being sent twice.
+    """
+    from modules import ai
+    row = db.get_conn().execute(
+        "SELECT occasion, area, personalize FROM campaigns WHERE id=?", (campaign_id,)
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"Unknown campaign {campaign_id}")
+    occasion, area, personalize = row
+    llm = llm or ai.get_llm(rate_limiter=campaign.make_rate_limiter())
+    outbox_key = f"campaign:{campaign_id}"
+    # Loaded once per run: bounces, unsubscribes and anyone greeted today by another campaign
+    suppressions = suppression.Suppressions.load(exclude_campaign=outbox_key)
+    _set_status(campaign_id, "running")
+    template = None if personalize else _template(campaign_id, llm, occasion, area)
+
+    while True:
+        chunk = _next_chunk(campaign_id, chunk_size)
+        if not chunk:
+            break
+        # Rows shaped like `users` rows so the campaign helpers can take them directly.
+        rows = [(user_id, name or "", email) for user_id, name, email in chunk]
+        users, updates = [], []
+        for user, reason in suppressions.check(rows):
+            if reason:
+                updates.append(("skipped", suppression.LABELS[reason], campaign_id, user[0]))
+            else:
+                users.append(user)
+        if personalize:
+            results = campaign.generate_greetings(ai.get_greeting_chain(llm), users, occasion)
+        else:
+            results = ((user, ai.render_greeting(template, user[1]), None) for user in users)
+        for user, result, error in results:
+            user_id, name, email = user
+            if error is not None:
+                updates.append(("failed", str(error), campaign_id, user_id))
+            else:
+                outbox.enqueue(outbox_key, email, result.subject, result.email, result.html_card)
+                updates.append(("queued", None, campaign_id, user_id))
+        with db.get_conn() as conn:
+            conn.executemany(
+                "UPDATE campaign_recipients SET status=?, error=?, updated_at=CURRENT_TIMESTAMP "
+                "WHERE campaign_id=? AND user_id=?",
+                updates
+            )
+    _set_status(campaign_id, "done")
+
+
+def run_forever(poll_interval=POLL_INTERVAL, schedule_festivals=False):
+    """Background runner: resume unfinished campaigns, then wait for new ones.
+
+    With `schedule_festivals`, each day's festival campaigns are created automatically.
+    """
+    scheduled_on = None
+    while True:
+        if schedule_festivals and scheduled_on != date.today():
+            scheduled_on = date.today()
+            schedule_festival_campaigns(scheduled_on)
+        row = db.get_conn().execute(
+            "SELECT id FROM campaigns WHERE status IN ('pending', 'running') ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row is None:
+            time.sleep(poll_interval)
+            continue
+        try:
+            run_campaign(row[0])
+        except Exception:
+            traceback.print_exc()
+            _set_status(row[0], "failed")
+
+
+if __name__ == "__main__":
+    # Runner process: python -m modules.campaign_runner [campaign_id | --festivals]   (from the email-sms directory)
+    db.init_db()
+    outbox.ensure_sender_thread()
+    if len(sys.argv) > 1 and sys.argv[1] != "--festivals":
+        run_campaign(int(sys.argv[1]))
+    else:
+        run_forever(schedule_festivals="--festivals" in sys.argv)
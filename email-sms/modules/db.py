@@ -1,12 +1,22 @@
 import sqlite3
-import pandas as pd
+import time
 import streamlit as st
-from datetime import datetime
-from modules import gmail
+from datetime import date, datetime, timedelta
+from modules import gmail_sync, db_pool
 DB_PATH = "emails.db"
+# Birthday formats seen in the UI (ISO) and in imported CSVs (US style).
+BIRTHDAY_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%m/%d/%y", "%d.%m.%Y")
+PAGE_SIZE = 50
+# Table totals shown under paged tables are recounted at most this often (writers invalidate them).
+COUNT_TTL_SECONDS = 30
+_counts = {}
+
+def get_conn():
+    """Pooled connection to DB_PATH for the current thread (do not close it)."""
+    return db_pool.get_connection(DB_PATH)
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn()
     cursor = conn.cursor()
     # Emails table
     cursor.execute('''
@@ -21,6 +31,12 @@ def init_db():
             reply TEXT
         )
     ''')
+    # Failed auto-reply attempts per email, so one bad email can't block the webhook queue
+    for column in ("reply_attempts INTEGER DEFAULT 0", "reply_error TEXT"):
+        try:
+            cursor.execute(f"ALTER TABLE emails ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
     # Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -47,92 +63,608 @@ def init_db():
         cursor.execute("ALTER TABLE festivals ADD COLUMN date TEXT")
     except sqlite3.OperationalError:
         pass  # Column already exists
+    # Festival calendar: 'MM-DD' key for festivals that recur every year on the same date
+    for column in ("month_day TEXT", "recurring INTEGER DEFAULT 0"):
+        try:
+            cursor.execute(f"ALTER TABLE festivals ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_festivals_area_date ON festivals(area, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_festivals_area_month_day ON festivals(area, month_day)")
+    backfill_festival_month_day(conn)
+    # Precomputed 'MM-DD' birthday key so lookups can use an index
+    try:
+        cursor.execute("ALTER TABLE users ADD COLUMN birth_md TEXT")
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_birth_md ON users(birth_md)")
+    backfill_birth_md(conn)
+    # Normalized email (trimmed, lowercased): imports upsert on it, so one address is one user
+    try:
+        cursor.execute("ALTER TABLE users ADD COLUMN email_key TEXT")
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_key ON users(email_key) WHERE email_key IS NOT NULL")
+    backfill_email_key(conn)
+    # Campaign targeting selects users by area
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_area ON users(area)")
+    # Small key/value store for sync cursors (e.g. the last Gmail historyId)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Durable queue of Gmail push notifications (see modules/webhook_queue.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS webhook_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mailbox TEXT,
+            history_id INTEGER,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            message_ids TEXT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # At most one pending job per mailbox that still has to sync: new notifications are
+    # merged into it. Jobs that already synced (message_ids checkpointed) stay retryable
+    # alongside it. Replaces idx_webhook_jobs_pending, which covered every pending job.
+    cursor.execute("DROP INDEX IF EXISTS idx_webhook_jobs_pending")
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_webhook_jobs_pending_sync ON webhook_jobs(mailbox) "
+        "WHERE status='pending' AND message_ids IS NULL"
+    )
+    # Outgoing mail queue, one row per (campaign, recipient) (see modules/outbox.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT,
+            body TEXT,
+            html TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL DEFAULT 0,
+            last_error TEXT,
+            message_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            UNIQUE (campaign, recipient)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+    # Normalized recipient (see email_key): B@x.com and b@x.com are one recipient per campaign
+    try:
+        cursor.execute("ALTER TABLE outbox ADD COLUMN recipient_key TEXT")
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    backfill_outbox_recipient_key(conn)
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_campaign_recipient_key ON outbox(campaign, recipient_key) "
+        "WHERE recipient_key IS NOT NULL"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_created_at ON outbox(created_at)")
+    # Addresses that must not be greeted again (see modules/suppression.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS suppressions (
+            email_key TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            source TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (email_key, reason)
+        )
+    ''')
+    # Resumable greeting campaigns (see modules/campaign_runner.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            occasion TEXT,
+            area TEXT,
+            personalize INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'pending',
+            template TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS campaign_recipients (
+            campaign_id INTEGER,
+            user_id INTEGER,
+            name TEXT,
+            email TEXT,
+            status TEXT DEFAULT 'pending',
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (campaign_id, user_id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_campaign_recipients_status ON campaign_recipients(campaign_id, status)")
+    # Newest-first keyset listing of emails
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_received_at ON emails(received_at)")
+    init_email_search(conn)
+    conn.commit()
+
+def init_email_search(conn):
+    """FTS5 index over emails, kept in sync by triggers on every insert/update/delete."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='emails_fts'").fetchone()
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+            subject, sender, snippet, body,
+            content='emails', content_rowid='rowid'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS emails_fts_insert AFTER INSERT ON emails BEGIN
+            INSERT INTO emails_fts(rowid, subject, sender, snippet, body)
+            VALUES (new.rowid, new.subject, new.sender, new.snippet, new.body);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN
+            INSERT INTO emails_fts(emails_fts, rowid, subject, sender, snippet, body)
+            VALUES ('delete', old.rowid, old.subject, old.sender, old.snippet, old.body);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS emails_fts_update AFTER UPDATE OF subject, sender, snippet, body ON emails BEGIN
+            INSERT INTO emails_fts(emails_fts, rowid, subject, sender, snippet, body)
+            VALUES ('delete', old.rowid, old.subject, old.sender, old.snippet, old.body);
+            INSERT INTO emails_fts(rowid, subject, sender, snippet, body)
+            VALUES (new.rowid, new.subject, new.sender, new.snippet, new.body);
+        END
+    ''')
+    if not exists:
+        rebuild_email_search(conn)
+
+def rebuild_email_search(conn=None):
+    # Also needed after VACUUM, which may renumber the implicit rowids of `emails`
+    conn = conn or get_conn()
+    conn.execute("INSERT INTO emails_fts(emails_fts) VALUES('rebuild')")
     conn.commit()
-    conn.close()
+
+def _fts_query(text):
+    # Quote every term so user input can't hit FTS syntax errors; prefix-match the last one
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+def search_emails(text, limit=20):
+    """Full-text search over subject, sender, snippet and body, best matches first."""
+    query = _fts_query(text)
+    if not query:
+        return []
+    cursor = get_conn().execute(
+        """
+        SELECT e.id, e.subject, e.sender, e.received_at, e.replied,
+               snippet(emails_fts, -1, '[', ']', '…', 16) AS match
+        FROM emails_fts JOIN emails e ON e.rowid = emails_fts.rowid
+        WHERE emails_fts MATCH ?
+        ORDER BY bm25(emails_fts)
+        LIMIT ?
+        """,
+        (query, limit)
+    )
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def list_emails(limit=50, before=None):
+    """One page of emails, newest first, using keyset pagination.
+
+    `before` is the `cursor` of the previous page's last row; the cost is the same for every page.
+    """
+    query = "SELECT rowid, id, subject, sender, snippet, received_at, replied FROM emails"
+    params = ()
+    if before:
+        query += " WHERE (received_at, rowid) < (?, ?)"
+        params = tuple(before)
+    cursor = get_conn().execute(query + " ORDER BY received_at DESC, rowid DESC LIMIT ?", params + (limit,))
+    columns = [c[0] for c in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    for row in rows:
+        row["cursor"] = (row["received_at"], row.pop("rowid"))
+    return rows
+
+def fetch_page(table, columns, before_id=None, limit=PAGE_SIZE, where=None, params=()):
+    """One page of `columns` from `table`, highest id first, as a DataFrame.
+
+    Keyset pagination: pass the last `id` of the previous page as `before_id`, so every
+    page costs one index range scan. `table`, `columns` and `where` are trusted SQL
+    fragments from the calling module; values go in `params`.
+    """
+    # pandas loads with the first table shown, not at cold start
+    import pandas as pd
+    clauses = [where] if where else []
+    params = tuple(params)
+    if before_id is not None:
+        clauses.append("id < ?")
+        params += (before_id,)
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    return pd.read_sql_query(query + " ORDER BY id DESC LIMIT ?", get_conn(), params=params + (limit,))
+
+def count_rows(table, where=None, params=()):
+    """Row count for a paged table, cached for COUNT_TTL_SECONDS."""
+    key = (table, where, tuple(params))
+    cached = _counts.get(key)
+    if cached and time.monotonic() - cached[0] < COUNT_TTL_SECONDS:
+        return cached[1]
+    query = f"SELECT COUNT(*) FROM {table}" + (f" WHERE {where}" if where else "")
+    total = get_conn().execute(query, key[2]).fetchone()[0]
+    _counts[key] = (time.monotonic(), total)
+    return total
+
+def invalidate_counts(table):
+    for key in [k for k in _counts if k[0] == table]:
+        _counts.pop(key, None)
+
+def page_cursor(state_key):
+    """Cursor of the page currently shown for `state_key` (None is the first page)."""
+    return st.session_state.setdefault(state_key, [None])[-1]
+
+def pager_controls(state_key, page_rows, next_cursor, page_size=PAGE_SIZE, total=None):
+    """Newer/Older buttons for a keyset-paged table; `next_cursor` starts the following page."""
+    cursors = st.session_state.setdefault(state_key, [None])
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    if col_prev.button("◀ Newer", key=f"{state_key}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    caption = f"Page {len(cursors)}"
+    if total is not None:
+        caption += f" · {total} total"
+    col_page.caption(caption)
+    if col_next.button("Older ▶", key=f"{state_key}_next", disabled=page_rows < page_size):
+        cursors.append(next_cursor)
+        st.rerun()
+
+def get_email_body(email_id):
+    """Body and stored reply of one email, loaded only when the user opens it."""
+    return get_conn().execute("SELECT body, reply FROM emails WHERE id=?", (email_id,)).fetchone()
+
+def get_sync_state(key, default=None):
+    row = get_conn().execute("SELECT value FROM sync_state WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_sync_state(key, value):
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+            "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+            (key, str(value))
+        )
+
+def advance_sync_state(key, value):
+    """set_sync_state for an increasing integer (e.g. a Gmail historyId): never moves it back.
+
+    Processes syncing concurrently can then finish in any order without rewinding each other.
+    """
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+            "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at "
+            "WHERE CAST(sync_state.value AS INTEGER) < CAST(excluded.value AS INTEGER)",
+            (key, str(value))
+        )
+
+def month_day(value):
+    """Return the 'MM-DD' key for a date or date string, or None if it can't be parsed."""
+    if not value:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%m-%d")
+    text = str(value).strip()
+    for fmt in BIRTHDAY_FORMATS:
+        try:
+            return datetime.strptime(text[:10] if fmt == "%Y-%m-%d" else text, fmt).strftime("%m-%d")
+        except ValueError:
+            continue
+    return None
+
+# Birthdays were the first 'MM-DD' key; festivals use the same one.
+birth_md = month_day
+
+def parse_dates(text):
+    """Vectorized `month_day` parsing: a string Series to datetimes (NaT where no format matches)."""
+    import pandas as pd
+    # Each format only looks at the values the previous ones could not parse.
+    parsed = pd.Series(pd.NaT, index=text.index, dtype="datetime64[ns]")
+    for fmt in BIRTHDAY_FORMATS:
+        todo = parsed.isna() & text.notna()
+        if not todo.any():
+            break
+        values = text[todo].str.slice(0, 10) if fmt == "%Y-%m-%d" else text[todo]
+        parsed[todo] = pd.to_datetime(values, format=fmt, errors="coerce")
+    return parsed
+
+def text_column(chunk, column):
+    """A CSV chunk column as trimmed strings, with blanks (or a missing column) as NA."""
+    import pandas as pd
+    if column not in chunk:
+        return pd.Series(pd.NA, index=chunk.index, dtype="string")
+    return chunk[column].astype("string").str.strip().replace("", pd.NA)
+
+def iso_dates(parsed):
+    import pandas as pd
+    # numpy's day-precision string cast is much faster than Series.dt.strftime
+    iso = pd.Series(parsed.to_numpy().astype("datetime64[D]").astype(str), index=parsed.index)
+    return iso.where(parsed.notna())
+
+def backfill_birth_md(conn):
+    """Fill birth_md for rows written before the column existed (or by older code)."""
+    rows = conn.execute(
+        "SELECT id, birthday FROM users WHERE birth_md IS NULL AND birthday IS NOT NULL AND birthday != ''"
+    ).fetchall()
+    updates = [(birth_md(b), user_id) for user_id, b in rows]
+    conn.executemany("UPDATE users SET birth_md=? WHERE id=?", [u for u in updates if u[0]])
+
+def backfill_festival_month_day(conn):
+    rows = conn.execute(
+        "SELECT id, date FROM festivals WHERE month_day IS NULL AND date IS NOT NULL AND date != ''"
+    ).fetchall()
+    updates = [(month_day(d), festival_id) for festival_id, d in rows]
+    conn.executemany("UPDATE festivals SET month_day=? WHERE id=?", [u for u in updates if u[0]])
+
+def email_key(email):
+    """Normalized form of an email address used for dedupe, or None if it isn't one."""
+    if not email or not isinstance(email, str) or "@" not in email:
+        return None
+    return email.strip().lower()
+
+def backfill_email_key(conn):
+    """Key rows written before email_key existed.
+
+    If older rows share an address, the lowest id gets the key and later copies
+    stay unkeyed, so nothing is deleted behind the user's back.
+    """
+    rows = conn.execute(
+        "SELECT id, email FROM users WHERE email_key IS NULL AND email IS NOT NULL AND email != '' ORDER BY id"
+    ).fetchall()
+    updates = ((key, user_id, key) for key, user_id in ((email_key(e), i) for i, e in rows) if key)
+    conn.executemany(
+        "UPDATE users SET email_key=? WHERE id=? AND NOT EXISTS (SELECT 1 FROM users WHERE email_key=?)",
+        updates
+    )
+
+def backfill_outbox_recipient_key(conn):
+    """Key outbox rows written before recipient_key existed; like backfill_email_key, per campaign."""
+    rows = conn.execute("SELECT id, campaign, recipient FROM outbox WHERE recipient_key IS NULL ORDER BY id").fetchall()
+    updates = (
+        (key, item_id, campaign, key)
+        for item_id, campaign, key in ((i, c, email_key(r)) for i, c, r in rows) if key
+    )
+    conn.executemany(
+        "UPDATE outbox SET recipient_key=? WHERE id=? "
+        "AND NOT EXISTS (SELECT 1 FROM outbox WHERE campaign=? AND recipient_key=?)",
+        updates
+    )
+
+def _md_range_clause(column, start, end):
+    # Month-day keys wrap at year end: Dec 28 -> Jan 3 becomes two ranges.
+    if start <= end:
+        return f"{column} BETWEEN ? AND ?", (start, end)
+    return f"({column} >= ? OR {column} <= ?)", (start, end)
 
 def get_today_birthdays():
     today = datetime.now().strftime("%m-%d")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE strftime('%m-%d', birthday) = ?", (today,))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    cursor = get_conn().execute("SELECT * FROM users WHERE birth_md = ?", (today,))
+    return cursor.fetchall()
+
+def get_upcoming_birthdays(days=7, start=None):
+    """Users whose birthday falls within the next `days` days (today included), soonest first."""
+    if days < 1:
+        return []
+    start = start or date.today()
+    start_md = start.strftime("%m-%d")
+    if days >= 365:
+        clause, params = "birth_md IS NOT NULL", ()
+    else:
+        # Inclusive range: today plus the following days - 1.
+        end_md = (start + timedelta(days=days - 1)).strftime("%m-%d")
+        clause, params = _md_range_clause("birth_md", start_md, end_md)
+    cursor = get_conn().execute(
+        f"SELECT * FROM users WHERE {clause} ORDER BY birth_md < ?, birth_md",
+        params + (start_md,)
+    )
+    return cursor.fetchall()
+
+def get_upcoming_festivals(days=7, area=None, start=None):
+    """Festivals in the next `days` days (today included), soonest first, optionally for one area.
+
+    One-off festivals match on their ISO date; recurring ones on their 'MM-DD' key,
+    every year. Each row is a dict with an extra `on` (ISO date of the occurrence).
+    """
+    if days < 1:
+        return []
+    start = start or date.today()
+    # Inclusive range: today plus the following days - 1.
+    end = start + timedelta(days=min(days, 365) - 1)
+    # Festivals without an area apply everywhere.
+    area_clause, area_params = ("(area = ? OR area IS NULL) AND ", (area,)) if area else ("", ())
+    if days >= 365:
+        md_clause, md_params = "month_day IS NOT NULL", ()
+    else:
+        md_clause, md_params = _md_range_clause("month_day", start.strftime("%m-%d"), end.strftime("%m-%d"))
+    # '~' sorts after any time suffix, so 'YYYY-MM-DD HH:MM:SS' values on the last day match too.
+    cursor = get_conn().execute(
+        f"""
+        SELECT id, area, name, date, month_day, recurring FROM festivals
+        WHERE {area_clause}date BETWEEN ? AND ? AND COALESCE(recurring, 0) = 0
+        UNION ALL
+        SELECT id, area, name, date, month_day, recurring FROM festivals
+        WHERE {area_clause}{md_clause} AND recurring = 1
+        """,
+        area_params + (start.isoformat(), end.isoformat() + "~") + area_params + md_params
+    )
+    columns = [c[0] for c in cursor.description]
+    festivals = []
+    for row in cursor.fetchall():
+        festival = dict(zip(columns, row))
+        if festival["recurring"]:
+            month, day = map(int, festival["month_day"].split("-"))
+            festival["on"] = _next_occurrence(month, day, start).isoformat()
+        else:
+            festival["on"] = festival["date"][:10]
+        festivals.append(festival)
+    return sorted(festivals, key=lambda f: (f["on"], f["name"] or ""))
+
+def _next_occurrence(month, day, start):
+    # Same month/day on or after `start`; Feb 29 falls back to Feb 28 in other years.
+    for year in (start.year, start.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            candidate = date(year, 2, 28)
+        if candidate >= start:
+            return candidate
+    return candidate
 
 def get_unreplied_emails_from_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, subject, sender, snippet, body, replied, reply FROM emails WHERE replied=0 ORDER BY received_at DESC")
-    rows = cursor.fetchall()
-    gmail.fetch_unread_emails()
-    conn.close()
-    return rows
+    cursor = get_conn().execute("SELECT id, subject, sender, snippet, body, replied, reply FROM emails WHERE replied=0 ORDER BY received_at DESC")
+    return cursor.fetchall()
 
 def update_reply_in_db(email_id, reply):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    from modules import gmail
     send_mail = gmail.get_email_detail(email_id, reply.subject, reply.reply)
     if not send_mail:
         st.error("Email not found in the database.")
         return
-    cursor.execute(
-        "UPDATE emails SET replied=1, reply=? WHERE id=?",
-        (str(reply), email_id)
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE emails SET replied=1, reply=? WHERE id=?",
+            (str(reply), email_id)
+        )
+
+def get_unreplied_emails_by_ids(email_ids):
+    if not email_ids:
+        return []
+    placeholders = ",".join("?" for _ in email_ids)
+    cursor = get_conn().execute(
+        f"SELECT id, subject, sender, snippet, body, reply_attempts FROM emails "
+        f"WHERE replied=0 AND id IN ({placeholders}) ORDER BY received_at",
+        list(email_ids)
     )
-    conn.commit()
-    conn.close()
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def get_unreplied_email_ids(since, max_attempts=None):
+    """Ids of stored emails not yet replied to, received at or after `since` ('YYYY-MM-DD HH:MM:SS'), oldest first.
+
+    With `max_attempts`, emails whose auto-reply already failed that many times are left out.
+    """
+    attempts_clause, params = ("AND COALESCE(reply_attempts, 0) < ? ", (max_attempts,)) if max_attempts else ("", ())
+    cursor = get_conn().execute(
+        f"SELECT id FROM emails WHERE replied=0 AND received_at >= ? {attempts_clause}ORDER BY received_at",
+        (since,) + params
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def record_reply_failure(email_id, error):
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE emails SET reply_attempts=COALESCE(reply_attempts, 0)+1, reply_error=? WHERE id=?",
+            (error, email_id)
+        )
 
+def mark_email_replied(email_id, reply_text):
+    with get_conn() as conn:
+        conn.execute("UPDATE emails SET replied=1, reply=? WHERE id=?", (reply_text, email_id))
+
+def sync_status():
+    """'Last synced' caption plus a manual sync button; the background service does the regular syncing."""
+    col_caption, col_button = st.columns([4, 1])
+    col_caption.caption(f"Last synced: {gmail_sync.last_synced() or 'never'}")
+    if col_button.button("Sync now"):
+        with st.spinner("Syncing mailbox..."):
+            gmail_sync.sync_mailbox()
+        st.rerun()
 
 def show_email_logs():
+    import pandas as pd
     st.header("Email Logs")
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM emails ORDER BY received_at DESC", conn)
-    gmail.fetch_unread_emails()
-    conn.close()
-    if not df.empty:
-        st.dataframe(df)
-    else:
+    sync_status()
+    page_size = PAGE_SIZE
+
+    search = st.text_input("Search emails", placeholder="subject, sender or text…")
+    if search:
+        results = search_emails(search, limit=page_size)
+        if results:
+            st.dataframe(pd.DataFrame(results))
+        else:
+            st.info("No emails match your search.")
+        return
+
+    rows = list_emails(limit=page_size, before=page_cursor("email_log_cursors"))
+    if not rows:
         st.info("No emails found in the database.")
+    else:
+        st.dataframe(pd.DataFrame(rows).drop(columns=["cursor"]))
+        by_id = {row["id"]: row for row in rows}
+        opened = st.selectbox(
+            "Open email", [None] + list(by_id),
+            format_func=lambda x: "—" if x is None else f"{by_id[x]['subject']} — {by_id[x]['sender']}"
+        )
+        if opened:
+            body, reply = get_email_body(opened) or (None, None)
+            with st.expander("Email", expanded=True):
+                st.text(body or by_id[opened]["snippet"] or "")
+                if reply:
+                    st.markdown("**Reply**")
+                    st.text(reply)
+    pager_controls(
+        "email_log_cursors", len(rows), rows[-1]["cursor"] if rows else None,
+        page_size=page_size, total=count_rows("emails")
+    )
 
 def manage_users_ui():
     st.header("Manage Users")
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM users", conn)
-    conn.close()
+    df = fetch_page("users", ("id", "name", "email", "phone", "birthday", "area", "dnc"), page_cursor("users_cursors"))
     st.dataframe(df)
+    pager_controls("users_cursors", len(df), int(df["id"].iloc[-1]) if len(df) else None, total=count_rows("users"))
     # Add more user management features as needed
 
 def manage_festivals_ui():
     st.header("Manage Festivals")
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM festivals", conn)
-    conn.close()
+    df = fetch_page("festivals", ("id", "area", "name", "date"), page_cursor("festivals_cursors"))
     st.dataframe(df)
+    pager_controls("festivals_cursors", len(df), int(df["id"].iloc[-1]) if len(df) else None, total=count_rows("festivals"))
     # Add more festival management features as needed
 
 # === Database Handling ===
-def save_emails_to_db(email_list):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS emails (
-            id TEXT PRIMARY KEY,
-            subject TEXT,
-            sender TEXT,
-            snippet TEXT,
-            body TEXT,
-            replied INTEGER DEFAULT 0,
-            reply TEXT,
-            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+def _email_rows(emails):
+    for item in emails:
+        yield (
+            item["id"], item.get("subject"), item.get("sender"), item.get("snippet"), item.get("body"),
+            int(item.get("replied") or 0), item.get("reply"), item.get("received_at"),
         )
-    ''')
-    for item in email_list:
-        cursor.execute("SELECT id FROM emails WHERE id=?", (item["id"],))
-        if cursor.fetchone():
-            continue
-        cursor.execute(
-            "INSERT INTO emails (id, subject, sender, snippet, body, replied, reply) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (item["id"], item["subject"], item["sender"], item["snippet"], item["body"], item["replied"], item["reply"])
+
+def save_emails_to_db(email_list):
+    """Insert new emails in one transaction, skipping ids already stored.
+
+    `email_list` may be any iterable of email dicts, including a generator:
+    rows are streamed into `executemany`, so a large backfill is never held in memory.
+    Returns the number of rows inserted.
+    """
+    conn = get_conn()
+    with conn:
+        cursor = conn.executemany(
+            """
+            INSERT INTO emails (id, subject, sender, snippet, body, replied, reply, received_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ON CONFLICT(id) DO NOTHING
+            """,
+            _email_rows(email_list)
         )
-    conn.commit()
-    conn.close()
+    # rowcount counts only rows this statement inserted: not DO NOTHING conflicts and
+    # not the emails_fts trigger's writes (which conn.total_changes would include).
+    inserted = max(cursor.rowcount, 0)
+    if inserted:
+        invalidate_counts("emails")
+    return inserted
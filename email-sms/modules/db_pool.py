@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+
+# Pragmas applied once to every pooled connection.
+# WAL lets Streamlit reruns read while a worker writes; NORMAL sync is safe under WAL.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# Number of prepared statements sqlite3 keeps compiled per connection.
+STATEMENT_CACHE_SIZE = 256
+
+# One connection per (thread, db file). sqlite3 connections must not be shared
+# across threads, so the thread is the pool boundary; when a thread exits its
+# connections are garbage collected with it.
+_local = threading.local()
+
+
+def _open(db_path):
+    conn = sqlite3.connect(db_path, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection(db_path):
+    """Return this thread's connection to `db_path`, opening it on first use.
+
+    Callers must not close it; use `with conn:` to commit or roll back a transaction.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = conns[db_path] = _open(db_path)
+    return conn
+
+
+def close_connection(db_path=None):
+    """Close this thread's connection to `db_path` (or all of them), e.g. when a worker stops."""
+    conns = getattr(_local, "conns", {})
+    for path in [db_path] if db_path else list(conns):
+        conn = conns.pop(path, None)
+        if conn is not None:
+            conn.close()
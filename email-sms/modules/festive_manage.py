@@ -1,47 +1,86 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-from tomlkit import date
 from modules import db
-print(st.__version__)
-def add_festival_to_db(area, name,date):
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO festivals (area, name, date) VALUES (?, ?, ?)",
-        (area, name, date)
-    )
-    conn.commit()
-    conn.close()
 
-def update_festival_in_db(festival_id, area, name, date=None):
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE festivals SET area=?, name=?, date=? WHERE id=?",
-        (area, name, date, festival_id)
-    )
-    conn.commit()
-    conn.close()
+FESTIVAL_COLUMNS = ("id", "area", "name", "date", "recurring")
+IMPORT_CHUNK_SIZE = 50_000
+CSV_COLUMNS = ["area", "name", "date", "recurring"]
+
+def add_festival_to_db(area, name, date, recurring=False):
+    with db.get_conn() as conn:
+        conn.execute(
+            "INSERT INTO festivals (area, name, date, month_day, recurring) VALUES (?, ?, ?, ?, ?)",
+            (area, name, str(date) if date else None, db.month_day(date), int(recurring))
+        )
+    db.invalidate_counts("festivals")
 
-def import_festivals_from_csv(csv_file):
-    df = pd.read_csv(csv_file)
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    for _, row in df.iterrows():
-        cursor.execute(
-            "INSERT INTO festivals (area, name, date) VALUES (?, ?, ?)",
-            (row.get("area"), row.get("name"), row.get("date"))
+def update_festival_in_db(festival_id, area, name, date=None, recurring=False):
+    with db.get_conn() as conn:
+        conn.execute(
+            "UPDATE festivals SET area=?, name=?, date=?, month_day=?, recurring=? WHERE id=?",
+            (area, name, str(date) if date else None, db.month_day(date), int(recurring), festival_id)
         )
-    conn.commit()
-    conn.close()
+
+def import_festivals_from_csv(csv_file, chunksize=IMPORT_CHUNK_SIZE):
+    """Bulk-load a festival calendar CSV (area, name, date[, recurring]).
+
+    Rows already in the calendar (same area, name and date) are skipped, so a
+    file can be re-imported safely. Returns inserted/skipped/rejected counts
+    and `errors`, a DataFrame of rejected rows.
+    """
+    conn = db.get_conn()
+    stats = {"inserted": 0, "skipped": 0, "rejected": 0}
+    reports = []
+    reader = pd.read_csv(
+        csv_file, chunksize=chunksize, dtype=str, keep_default_na=False,
+        usecols=lambda column: column in CSV_COLUMNS,
+    )
+    for chunk in reader:
+        text = {column: db.text_column(chunk, column) for column in CSV_COLUMNS}
+        parsed = db.parse_dates(text["date"])
+        iso = db.iso_dates(parsed)
+        reason = pd.Series(pd.NA, index=chunk.index, dtype="string")
+        reason = reason.mask(parsed.isna(), "invalid date").mask(text["date"].isna(), "missing date")
+        reason = reason.mask(text["name"].isna(), "missing name")
+        rejected = reason.notna()
+        if rejected.any():
+            reports.append(pd.DataFrame({
+                "line": chunk.index[rejected.to_numpy()] + 2,
+                "name": text["name"][rejected],
+                "reason": reason[rejected],
+            }))
+        ok = ~rejected
+        clean = pd.DataFrame({
+            "area": text["area"][ok],
+            "name": text["name"][ok],
+            "date": iso[ok],
+            "month_day": iso[ok].str.slice(5),
+            "recurring": text["recurring"][ok].str.lower().isin(["1", "1.0", "true", "yes", "y"]).astype(int),
+        })
+        clean = clean.astype(object).where(clean.notna(), None)
+        rows = ((*row, row[0], row[1], row[2]) for row in clean.itertuples(index=False, name=None))
+        with conn:
+            written = conn.total_changes
+            conn.executemany(
+                """
+                INSERT INTO festivals (area, name, date, month_day, recurring)
+                SELECT ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM festivals WHERE area IS ? AND name IS ? AND date = ?)
+                """,
+                rows
+            )
+            inserted = conn.total_changes - written
+        stats["inserted"] += inserted
+        stats["skipped"] += int(ok.sum()) - inserted
+        stats["rejected"] += int(rejected.sum())
+    stats["errors"] = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=["line", "name", "reason"])
+    db.invalidate_counts("festivals")
+    return stats
 
 def delete_festival_from_db(festival_id):
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM festivals WHERE id=?", (festival_id,))
-    conn.commit()
-    conn.close()
+    with db.get_conn() as conn:
+        conn.execute("DELETE FROM festivals WHERE id=?", (festival_id,))
+    db.invalidate_counts("festivals")
 
     
 def festive_manage_ui():
@@ -58,34 +97,48 @@ def festive_manage_ui():
                 area = st.selectbox("Area", [user_area], disabled=True)
             else:
                 # Fetch all unique areas from the users table for selection
-                conn = sqlite3.connect(db.DB_PATH)
+                conn = db.get_conn()
                 df_areas = pd.read_sql_query("SELECT DISTINCT area FROM users", conn)
-                conn.close()
                 areas = df_areas["area"].dropna().unique().tolist()
                 area = st.selectbox("Area", areas)
             name = st.text_input("Festival Name")
-            date = st.date_input("Festival Date")   # Optional date input, not stored in DB but can be used for display
+            date = st.date_input("Festival Date")
+            recurring = st.checkbox("Same date every year")
             submitted = st.form_submit_button("Add Festival")
             if submitted:
-                add_festival_to_db(area, name, date)
+                add_festival_to_db(area, name, date, recurring)
                 st.success("Festival added successfully.")
 
     with col2:
         st.subheader("Import Festivals via CSV")
         csv_file = st.file_uploader("Upload Festival CSV", type="csv")
-        if csv_file is not None:
-            import_festivals_from_csv(csv_file)
-            st.success("Festivals imported successfully.")
+        st.caption("Columns: area, name, date, recurring (optional, 1 = same date every year).")
+        if csv_file is not None and st.button("Import Festivals"):
+            with st.spinner("Importing festivals..."):
+                stats = import_festivals_from_csv(csv_file)
+            st.success(f"Imported festivals: {stats['inserted']} new, {stats['skipped']} already in the calendar.")
+            if stats["rejected"]:
+                st.warning(f"{stats['rejected']} rows were rejected.")
+                st.dataframe(stats["errors"].head(100))
 
-    st.subheader("All Festivals")
-    conn = sqlite3.connect(db.DB_PATH)
-    if user_area:
-        df = pd.read_sql_query("SELECT * FROM festivals WHERE area = ?", conn, params=(user_area,))
+    st.subheader("Coming Up (next 30 days)")
+    upcoming = db.get_upcoming_festivals(days=30, area=user_area)
+    if upcoming:
+        st.dataframe(pd.DataFrame(upcoming)[["on", "name", "area", "recurring"]])
     else:
-        df = pd.read_sql_query("SELECT * FROM festivals", conn)
-    conn.close()
+        st.info("No festivals in the next 30 days.")
+
+    st.subheader("All Festivals")
+    where, params = ("area = ?", (user_area,)) if user_area else (None, ())
+    # One cursor stack per area filter, so switching areas starts from the first page.
+    state_key = f"festivals_cursors:{user_area or ''}"
+    df = db.fetch_page("festivals", FESTIVAL_COLUMNS, db.page_cursor(state_key), where=where, params=params)
+    st.dataframe(df)
+    db.pager_controls(
+        state_key, len(df), int(df["id"].iloc[-1]) if len(df) else None,
+        total=db.count_rows("festivals", where, params)
+    )
     if not df.empty:
-        st.dataframe(df)
 
         st.subheader("Update or Delete Festival")
         festival_ids = df["id"].tolist()
@@ -104,9 +157,10 @@ def festive_manage_ui():
                 area = st.text_input("Area", value=festival_row["area"])
             name = st.text_input("Festival Name", value=festival_row["name"])
             date = st.date_input("Festival Date", value=pd.to_datetime(festival_row["date"]).date() if pd.notna(festival_row["date"]) else None)
+            recurring = st.checkbox("Same date every year", value=bool(festival_row["recurring"]))
             update_submitted = st.form_submit_button("Update Festival")
             if update_submitted:
-                update_festival_in_db(selected_festival_id, area, name)
+                update_festival_in_db(selected_festival_id, area, name, date, recurring)
                 st.success("Festival updated successfully.")
                 st.experimental_rerun()
 
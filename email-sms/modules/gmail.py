@@ -1,32 +1,16 @@
 import os
-import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
 import base64
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import datetime
+import time
 import modules.db as db
-print("Current working directory:", os.getcwd())
+from modules import gmail_client, mail_builder
 base_dir = os.path.dirname(os.path.abspath(__file__))
 file_path = os.path.join(base_dir, 'greetings.html')
-SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
-print("File path:", file_path)
 def gmail_authenticate():
-    creds = None
-    if os.path.exists('token.pkl'):
-        with open('token.pkl', 'rb') as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.pkl', 'wb') as token:
-            pickle.dump(creds, token)
-    return build('gmail', 'v1', credentials=creds)
+    # Cached process-wide; see modules/gmail_client.py
+    return gmail_client.get_service()
 
 def get_email_header(msg_detail, name):
     if not msg_detail or 'payload' not in msg_detail or 'headers' not in msg_detail['payload']:
@@ -71,31 +55,109 @@ def convert_timestamp_to_datetime(timestamp_ms):
     except (ValueError, TypeError):
         return "(Invalid Date)"
 
-def fetch_unread_emails(max_results=20):
-    service = gmail_authenticate()
-    results = service.users().messages().list(userId='me', labelIds=['INBOX'], q="is:unread", maxResults=max_results).execute()
-    messages = results.get('messages', [])
-    
+# Gmail recommends at most 50 calls per batch request.
+BATCH_SIZE = 50
+# Override to point batch requests at another endpoint (e.g. a local fake Gmail server).
+GMAIL_BATCH_URI = None
+METADATA_HEADERS = ['From', 'Subject', 'Date']
+
+def _new_batch(service, callback):
+    if GMAIL_BATCH_URI:
+        return BatchHttpRequest(callback=callback, batch_uri=GMAIL_BATCH_URI)
+    return service.new_batch_http_request(callback=callback)
+
+def email_from_detail(msg_detail):
+    return {
+        'id': msg_detail['id'],
+        'sender': get_email_header(msg_detail, 'From'),
+        'subject': get_email_header(msg_detail, 'Subject'),
+        'snippet': msg_detail.get('snippet', '(No snippet)'),
+        'received_at': convert_timestamp_to_datetime(msg_detail.get('internalDate')),
+        'body': get_email_content(msg_detail),
+        'replied': False,  # Default to False, can be updated later
+        'reply': ''  # Default empty reply
+    }
+
+class BatchFetchError(Exception):
+    """Some messages still failed with 429/5xx after every retry.
+
+    `failed_ids` are the ids that could not be fetched; `details` holds the ones
+    that were, so callers can keep them without checkpointing past the failures.
+    """
+
+    def __init__(self, failed_ids, details):
+        super().__init__(f"{len(failed_ids)} message(s) could not be fetched: {', '.join(failed_ids[:5])}")
+        self.failed_ids = failed_ids
+        self.details = details
+
+def get_messages_batched(service, message_ids, batch_size=BATCH_SIZE, msg_format='metadata', retries=3):
+    """Fetch many messages with Gmail batch requests (one HTTP round trip per `batch_size` ids).
+
+    Items rejected with 429/5xx are retried in a later batch with backoff; if some
+    still fail after `retries`, BatchFetchError is raised. Other errors (e.g. a
+    deleted message) are logged and skipped. Returns message details in the order
+    of `message_ids`.
+    """
+    details = {}
+    failed = []
+
+    def on_response(request_id, response, exception):
+        if exception is None:
+            details[request_id] = response
+        elif isinstance(exception, HttpError) and exception.resp.status in (429, 500, 502, 503):
+            failed.append(request_id)
+        else:
+            print(f"Failed to fetch message {request_id}: {exception}")
+
+    pending = list(message_ids)
+    for attempt in range(retries + 1):
+        for start in range(0, len(pending), batch_size):
+            batch = _new_batch(service, on_response)
+            for msg_id in pending[start:start + batch_size]:
+                kwargs = {'metadataHeaders': METADATA_HEADERS} if msg_format == 'metadata' else {}
+                batch.add(
+                    service.users().messages().get(userId='me', id=msg_id, format=msg_format, **kwargs),
+                    request_id=msg_id
+                )
+            batch.execute()
+        if not failed or attempt == retries:
+            break
+        pending, failed = failed, []
+        time.sleep(min(2 ** attempt, 8))
+    fetched = [details[msg_id] for msg_id in message_ids if msg_id in details]
+    if failed:
+        raise BatchFetchError(failed, fetched)
+    return fetched
+
+def list_unread_pages(service, page_size=100, max_pages=None):
+    """Yield lists of unread INBOX message refs, following nextPageToken."""
+    request = service.users().messages().list(userId='me', labelIds=['INBOX'], q="is:unread", maxResults=page_size)
+    pages = 0
+    while request is not None:
+        response = request.execute()
+        yield response.get('messages', [])
+        pages += 1
+        if max_pages and pages >= max_pages:
+            break
+        request = service.users().messages().list_next(request, response)
+
+def fetch_unread_emails(max_results=20, all_pages=False, service=None):
+    """Fetch unread INBOX emails and store them, one batch fetch and one DB write per page.
+
+    By default only the first `max_results` messages are read, as before;
+    `all_pages=True` walks the whole unread list in pages of `max_results`.
+    """
+    service = service or gmail_authenticate()
     email_list = []
-    for msg in messages:
-        msg_id = msg['id']
-        msg_detail = service.users().messages().get(userId='me', id=msg_id, format='metadata', metadataHeaders=['From', 'Subject', 'Date']).execute()
-        
-        sender = get_email_header(msg_detail, 'From')
-        subject = get_email_header(msg_detail, 'Subject')
-        snippet = msg_detail.get('snippet', '(No snippet)')
-
-        email_list.append({
-            'id': msg_id,
-            'sender': sender,
-            'subject': subject,
-            'snippet': snippet,
-            'received_at': convert_timestamp_to_datetime(msg_detail.get('internalDate')),
-            'body': get_email_content(msg_detail),
-            'replied': False,  # Default to False, can be updated later
-            'reply': ''  # Default empty reply
-        })
-        db.save_emails_to_db(email_list)
+    for messages in list_unread_pages(service, page_size=max_results, max_pages=None if all_pages else 1):
+        try:
+            details = get_messages_batched(service, [msg['id'] for msg in messages])
+        except BatchFetchError as e:
+            db.save_emails_to_db([email_from_detail(msg_detail) for msg_detail in e.details])
+            raise
+        page = [email_from_detail(msg_detail) for msg_detail in details]
+        db.save_emails_to_db(page)
+        email_list.extend(page)
     return email_list
 
 def get_email_detail(message_id):
@@ -104,28 +166,18 @@ def get_email_detail(message_id):
     msg_detail = service.users().messages().get(userId='me', id=message_id, format='full').execute()
     return msg_detail
 
-def send_email(to, subject, body):
+def send_email(to, subject, body, html=None):
+    """Send a greeting: `body` as the plain-text part and `html` (e.g. GreetingOutput.html_card)
+    as the HTML part, falling back to the cached greetings.html card."""
     service = gmail_authenticate()
-    message = MIMEMultipart('alternative')
-    message['to'] = to
-    message['subject'] = subject
+    if html is None:
+        try:
+            html = mail_builder.render_template(file_path, subject, body)
+        except FileNotFoundError:
+            print(f"Error: File not found -> greetings.html")
+            return
+    raw_message = mail_builder.build_raw_message(to, subject, body, html)
 
-        # Determine if the file is HTML or plain text
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except FileNotFoundError:
-        print(f"Error: File not found -> greetings.html")
-        return
-
-    ext = os.path.splitext(file_path)[1].lower()
-
-    # Assuming plain text for now. Can extend to HTML later.
-    msg_text = MIMEText(content, 'html' if ext == '.html' else 'plain')
-    message.attach(msg_text)
-
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    
     try:
         sent_message = service.users().messages().send(
             userId='me', 
@@ -137,6 +189,12 @@ def send_email(to, subject, body):
         print(f"An error occurred: {e}")
         raise # Re-raise the exception to be caught by Streamlit UI
 
+def send_reply(to, subject, body):
+    service = gmail_authenticate()
+    subject = subject if subject.lower().startswith('re:') else f"Re: {subject}"
+    raw_message = mail_builder.build_raw_message(to, subject, text=body)
+    return service.users().messages().send(userId='me', body={'raw': raw_message}).execute()
+
 def mark_as_read(message_id):
     service = gmail_authenticate()
     service.users().messages().modify(
@@ -0,0 +1,102 @@
+import datetime
+import os
+import pickle
+import threading
+
+import httplib2
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+TOKEN_PATH = 'token.pkl'
+CREDENTIALS_PATH = 'credentials.json'
+# Refresh the access token this long before it expires instead of on the first 401.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Process-wide cache: one set of credentials and one Gmail service object.
+# httplib2 is not thread-safe, so each thread gets its own authorized Http
+# (and keeps its own keep-alive connections) via the service's requestBuilder.
+_lock = threading.RLock()
+_creds = None
+_service = None
+_generation = 0  # bumped by reset() so threads drop Http objects bound to old credentials
+_local = threading.local()
+
+
+def _save_credentials(creds):
+    with open(TOKEN_PATH, 'wb') as token:
+        pickle.dump(creds, token)
+
+
+def _load_credentials():
+    creds = None
+    if os.path.exists(TOKEN_PATH):
+        with open(TOKEN_PATH, 'rb') as token:
+            creds = pickle.load(token)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
+            creds = flow.run_local_server(port=0)
+        _save_credentials(creds)
+    return creds
+
+
+def _expires_soon(creds):
+    if not creds.valid:
+        return True
+    # google-auth keeps `expiry` as a naive UTC datetime.
+    return creds.expiry is not None and creds.expiry - datetime.datetime.utcnow() < REFRESH_MARGIN
+
+
+def get_credentials():
+    """Cached OAuth credentials, refreshed proactively shortly before they expire."""
+    global _creds
+    with _lock:
+        if _creds is None:
+            _creds = _load_credentials()
+        elif _expires_soon(_creds) and _creds.refresh_token:
+            _creds.refresh(Request())
+            _save_credentials(_creds)
+        return _creds
+
+
+def _thread_http():
+    http = getattr(_local, 'http', None)
+    if http is None or _local.generation != _generation:
+        http = _local.http = AuthorizedHttp(get_credentials(), http=httplib2.Http())
+        _local.generation = _generation
+    return http
+
+
+def _build_request(http, *args, **kwargs):
+    return HttpRequest(_thread_http(), *args, **kwargs)
+
+
+def get_service():
+    """Shared Gmail API service, built once per process from the bundled discovery document."""
+    global _service
+    get_credentials()
+    with _lock:
+        if _service is None:
+            _service = build(
+                'gmail', 'v1',
+                http=_thread_http(),
+                requestBuilder=_build_request,
+                static_discovery=True,
+                cache_discovery=False,
+            )
+        return _service
+
+
+def reset():
+    """Drop cached credentials and service, e.g. after token.pkl was replaced."""
+    global _creds, _service, _generation
+    with _lock:
+        _creds = None
+        _service = None
+        _generation += 1
@@ -0,0 +1,136 @@
+import sys
+import threading
+import traceback
+from datetime import datetime
+
+from modules import db
+
+# sync_state key holding the mailbox historyId we last synced up to.
+HISTORY_KEY = "gmail_history_id"
+# Cap for a full resync (first run or expired historyId): pages of PAGE_SIZE unread messages.
+FULL_SYNC_MAX_PAGES = 5
+PAGE_SIZE = 100
+# sync_state key holding the local time of the last successful sync, shown by the views.
+LAST_SYNCED_KEY = "gmail_last_synced"
+# How often the background service polls the mailbox.
+SYNC_INTERVAL_SECONDS = 60
+
+_sync_lock = threading.Lock()
+
+
+def _gmail():
+    # Gmail client libraries load on first sync, not when the app imports this module.
+    from modules import gmail
+    return gmail
+
+
+def sync_mailbox(service=None):
+    """Bring emails.db up to date with the INBOX and return the newly seen emails.
+
+    After the first full sync this costs one `history.list` call when nothing changed.
+    """
+    from googleapiclient.errors import HttpError
+
+    service = service or _gmail().gmail_authenticate()
+    # One sync at a time per process; the background service and "Sync now" share this.
+    # Other processes (the webhook workers) may sync concurrently: saves are idempotent
+    # and the historyId only moves forward, so they don't need to coordinate.
+    with _sync_lock:
+        history_id = db.get_sync_state(HISTORY_KEY)
+        if history_id is None:
+            emails = full_sync(service)
+        else:
+            try:
+                emails = incremental_sync(service, history_id)
+            except HttpError as e:
+                # Gmail only keeps about a week of history; an expired start id returns 404.
+                if e.resp.status != 404:
+                    raise
+                print(f"History {history_id} expired, running full resync")
+                emails = full_sync(service)
+        db.set_sync_state(LAST_SYNCED_KEY, datetime.now().isoformat(sep=" ", timespec="seconds"))
+    return emails
+
+
+def last_synced():
+    """Local time of the last successful sync as 'YYYY-MM-DD HH:MM:SS', or None if never synced."""
+    return db.get_sync_state(LAST_SYNCED_KEY)
+
+
+def full_sync(service):
+    gmail = _gmail()
+    # Take the mailbox position before listing, so anything that arrives while
+    # we page through unread mail is replayed by the next incremental sync.
+    history_id = service.users().getProfile(userId="me").execute()["historyId"]
+    emails = []
+    for messages in gmail.list_unread_pages(service, page_size=PAGE_SIZE, max_pages=FULL_SYNC_MAX_PAGES):
+        emails.extend(_store_messages(service, [msg["id"] for msg in messages]))
+    db.advance_sync_state(HISTORY_KEY, history_id)
+    return emails
+
+
+def incremental_sync(service, start_history_id):
+    request = service.users().history().list(
+        userId="me", startHistoryId=start_history_id, historyTypes=["messageAdded"], labelId="INBOX"
+    )
+    added = {}
+    latest = start_history_id
+    while request is not None:
+        response = request.execute()
+        for record in response.get("history", []):
+            for item in record.get("messagesAdded", []):
+                message = item["message"]
+                if "UNREAD" in message.get("labelIds", []):
+                    added[message["id"]] = None
+        latest = response.get("historyId", latest)
+        request = service.users().history().list_next(request, response)
+    emails = _store_messages(service, list(added)) if added else []
+    db.advance_sync_state(HISTORY_KEY, latest)
+    return emails
+
+
+def _store_messages(service, message_ids):
+    gmail = _gmail()
+    try:
+        details = gmail.get_messages_batched(service, message_ids)
+    except gmail.BatchFetchError as e:
+        # Keep what arrived, but let the error stop the sync before it moves the
+        # historyId past the failed ids; the next sync replays them (saves are idempotent).
+        db.save_emails_to_db([gmail.email_from_detail(msg_detail) for msg_detail in e.details])
+        raise
+    emails = [gmail.email_from_detail(msg_detail) for msg_detail in details]
+    db.save_emails_to_db(emails)
+    return emails
+
+
+def run_forever(interval=SYNC_INTERVAL_SECONDS, stop_event=None):
+    """Sync service: keep emails.db fresh so the views only ever read the database."""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            sync_mailbox()
+        except Exception:
+            traceback.print_exc()
+        stop_event.wait(interval)
+
+
+_sync_thread = None
+_thread_lock = threading.Lock()
+
+
+def ensure_sync_thread():
+    """Start one background sync thread per process (used by the Streamlit app)."""
+    global _sync_thread
+    with _thread_lock:
+        if _sync_thread is None or not _sync_thread.is_alive():
+            _sync_thread = threading.Thread(target=run_forever, name="gmail-sync", daemon=True)
+            _sync_thread.start()
+
+
+if __name__ == "__main__":
+    # Standalone sync service: python -m modules.gmail_sync [--once]   (from the email-sms directory)
+    db.init_db()
+    if "--once" in sys.argv:
+        print(f"synced {len(sync_mailbox())} new emails")
+    else:
+        run_forever()
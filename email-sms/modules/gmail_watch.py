@@ -1,26 +1,11 @@
 import streamlit as st
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-import pickle
-import os
-
-SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+from modules import gmail_client
 
 def authenticate():
-    creds = None
-    if os.path.exists("token.pkl"):
-        with open("token.pkl", "rb") as token:
-            creds = pickle.load(token)
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-        creds = flow.run_local_server(port=0)
-        with open("token.pkl", "wb") as token:
-            pickle.dump(creds, token)
-    return creds
+    return gmail_client.get_credentials()
 
 def setup_watch(topic_name):
-    creds = authenticate()
-    service = build("gmail", "v1", credentials=creds)
+    service = gmail_client.get_service()
     body = {
         "labelIds": ["INBOX"],
         "topicName": topic_name
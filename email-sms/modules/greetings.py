@@ -1,13 +1,17 @@
 import streamlit as st
-from modules import db, ai, gmail 
+from datetime import date
+from modules import db, campaign_runner, outbox, resources, suppression
+
+FIELD_LABELS = {"subject": "Subject", "sms": "SMS", "email": "Email"}
 
 def greeting_workflow():
     st.header("Greeting Workflow")
 
-    tab1, tab2, tab3 = st.tabs([
+    tab1, tab2, tab3, tab4 = st.tabs([
         "🎂 Birthday Greetings",
         "🎉 Festival Greetings",
-        "🌍 Global/Custom Message"
+        "🌍 Global/Custom Message",
+        "📋 Campaigns"
     ])
 
     # --- Birthday Greetings ---
@@ -17,24 +21,33 @@ def greeting_workflow():
             users = db.get_today_birthdays()
             if users:
                 st.subheader("Today's Birthdays")
+                suppressions = suppression.Suppressions.load(exclude_campaign=f"birthday:{date.today()}")
                 for user in users:
                     user_id, name, email, phone, birthday, area = user[:6]
                     dnc = user[6] if len(user) > 6 else 0
                     st.markdown(f"**Name:** {name} | **Email:** {email} | **Phone:** {phone} | **Area:** {area} | **DNC:** {'Yes' if dnc else 'No'}")
-                    if dnc:
-                        st.warning("Do Not Contact is enabled for this user. Greeting will not be sent.")
+                    reason = "dnc" if dnc else suppressions.reason(email)
+                    if reason:
+                        st.warning(f"Skipped ({suppression.LABELS[reason]}). Greeting will not be sent.")
                         continue
-                    llm = ai.get_llm()
-                    greeting_chain = ai.get_greeting_chain(llm)
                     if st.button(f"Generate Birthday Greeting for {name}", key=f"bday_{user_id}"):
-                        result = greeting_chain.invoke({"name": name, "occasion": "Birthday"})
-                        gmail.send_email(email,result.subject, result.email)
-                        st.write(f"**Subject:** {result.subject}")
-                        st.write(f"**Email:** {result.email}")
-                        st.write(f"**SMS:** {result.sms}")
-                        st.markdown("---")
-                        st.markdown("**HTML Card Preview:**", unsafe_allow_html=True)
-                        st.markdown(result.html_card, unsafe_allow_html=True)
+                        from modules import ai
+                        # Each field is shown as soon as the model has finished writing it
+                        slots = {field: st.empty() for field in ("subject", "sms", "email", "html_card")}
+                        slots["html_card"].caption("Writing HTML card...")
+                        inputs = {"name": name, "occasion": "Birthday"}
+                        for field, value in ai.stream_greeting(resources.greeting_stream_chain(), inputs, fixup_llm=resources.llm()):
+                            if field == "result":
+                                result = value
+                            elif field == "html_card":
+                                with slots[field].container():
+                                    st.markdown("---")
+                                    st.markdown("**HTML Card Preview:**", unsafe_allow_html=True)
+                                    st.markdown(value, unsafe_allow_html=True)
+                            elif field in slots:
+                                slots[field].write(f"**{FIELD_LABELS[field]}:** {value}")
+                        outbox.enqueue(f"birthday:{date.today()}", email, result.subject, result.email, result.html_card)
+                        resources.outbox_sender()
             else:
                 st.info("No birthdays today.")
 
@@ -57,7 +70,7 @@ def greeting_workflow():
         with col1:
             st.subheader("Festival Greetings by Area")
             # Get unique areas from users table
-            conn = db.sqlite3.connect(db.DB_PATH)
+            conn = db.get_conn()
             cursor = conn.cursor()
             cursor.execute("SELECT DISTINCT area FROM users WHERE area IS NOT NULL AND area != ''")
             areas = [row[0] for row in cursor.fetchall()]
@@ -65,41 +78,35 @@ def greeting_workflow():
 
             area = st.selectbox("Select Area", areas) if areas else st.text_input("Enter Area")
             if area:
-                cursor.execute("SELECT name FROM festivals WHERE area=?", (area,))
-                festivals = [row[0] for row in cursor.fetchall()]
-                festival = st.selectbox("Select Festival", festivals) if festivals else st.text_input("Enter Festival Name")
+                # Next occurrence of each festival for this area, soonest first, then the
+                # area's other festivals (past one-off dates, or no date at all)
+                upcoming = {}
+                for item in db.get_upcoming_festivals(days=365, area=area):
+                    upcoming.setdefault(item["name"], item["on"])
+                cursor.execute("SELECT DISTINCT name FROM festivals WHERE area=? ORDER BY name", (area,))
+                others = [row[0] for row in cursor.fetchall() if row[0] and row[0] not in upcoming]
+                festivals = list(upcoming) + others
+                festival = st.selectbox(
+                    "Select Festival", festivals,
+                    format_func=lambda name: f"{name} ({upcoming[name]})" if name in upcoming else name
+                ) if festivals else st.text_input("Enter Festival Name")
+
+            personalize = st.checkbox(
+                "Personalize each greeting with AI (one LLM call per user)",
+                key="festival_personalize",
+                help="Off: the AI writes one template for the area and each user's name is filled in locally."
+            )
 
             if area and festival and st.button("Generate Festival Greetings"):
-                # Get users by area
-                conn = db.sqlite3.connect(db.DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users WHERE area=?", (area,))
-                users_in_area = cursor.fetchall()
-                conn.close()
-                if users_in_area:
-                    llm = ai.get_llm()
-                    greeting_chain = ai.get_greeting_chain(llm)
-                    for user in users_in_area:
-                        user_id, name, email, phone, birthday, area = user[:6]
-                        dnc = user[6] if len(user) > 6 else 0
-                        st.markdown(f"**Name:** {name} | **Email:** {email} | **Phone:** {phone} | **DNC:** {'Yes' if dnc else 'No'}")
-                        if dnc:
-                            st.warning("Do Not Contact is enabled for this user. Greeting will not be sent.")
-                            continue
-                        result = greeting_chain.invoke({"name": name, "occasion": festival})
-                        gmail.send_email(email, result.subject, result.email,)
-                        st.write(f"**Subject:** {result.subject}")
-                        st.write(f"**Email:** {result.email}")
-                        st.write(f"**SMS:** {result.sms}")
-                        st.markdown("---")
-                        st.markdown("**HTML Card Preview:**", unsafe_allow_html=True)
-                        st.markdown(result.html_card, unsafe_allow_html=True)
-                else:
-                    st.info("No users found in this area.")
+                # Same name as the runner's scheduled festival campaigns, so the same
+                # festival/area is only ever one campaign per day
+                name = f"festival:{festival}:{area}:{date.today()}"
+                st.session_state["festival_campaign"] = _start_campaign(name, festival, [area], personalize)
+            _poll_campaign("festival_campaign")
 
         with col2:
             # Show users in selected area
-            conn = db.sqlite3.connect(db.DB_PATH)
+            conn = db.get_conn()
             cursor = conn.cursor()
             if 'area' in locals() and area:
                 cursor.execute("SELECT name, email, phone, dnc FROM users WHERE area=?", (area,))
@@ -111,17 +118,15 @@ def greeting_workflow():
                     st.dataframe(df)
                 else:
                     st.info(f"No users found in {area}.")
-            conn.close()
 
     # --- Global/Custom Message ---
     with tab3:
         st.subheader("Send Global/Custom Message")
         # Fetch all unique areas from users table for selection
-        conn = db.sqlite3.connect(db.DB_PATH)
+        conn = db.get_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT DISTINCT area FROM users WHERE area IS NOT NULL AND area != ''")
         areas = [row[0] for row in cursor.fetchall()]
-        conn.close()
 
         area_options = ["All (Global)"] + areas if areas else ["All (Global)"]
         selected_areas = st.multiselect(
@@ -131,32 +136,80 @@ def greeting_workflow():
         )
         custom_occasion = st.text_input("Occasion/Message Title", value="New Year")
         custom_message = st.text_area("Custom Message (optional, will be used as context for AI)", value="")
+        global_personalize = st.checkbox(
+            "Personalize each greeting with AI (one LLM call per user)",
+            key="global_personalize",
+            help="Off: the AI writes one template and each user's name is filled in locally."
+        )
 
         if st.button("Generate Global Greetings"):
-            # Determine which users to select
-            conn = db.sqlite3.connect(db.DB_PATH)
-            cursor = conn.cursor()
-            if not selected_areas or "All (Global)" in selected_areas:
-                cursor.execute("SELECT * FROM users")
-            else:
-                placeholders = ",".join("?" for _ in selected_areas)
-                query = f"SELECT * FROM users WHERE area IN ({placeholders})"
-                cursor.execute(query, selected_areas)
-            all_users = cursor.fetchall()
-            conn.close()
-            llm = ai.get_llm()
-            greeting_chain = ai.get_greeting_chain(llm)
-            for user in all_users:
-                user_id, name, email, phone, birthday, area = user[:6]
-                dnc = user[6] if len(user) > 6 else 0
-                if dnc:
-                    continue
-                context = custom_message if custom_message else custom_occasion
-                result = greeting_chain.invoke({"name": name, "occasion": context})
-                st.markdown(f"**Name:** {name} | **Email:** {email} | **Phone:** {phone}")
-                st.write(f"**Subject:** {result.subject}")
-                st.write(f"**Email:** {result.email}")
-                st.write(f"**SMS:** {result.sms}")
-                st.markdown("---")
-                st.markdown("**HTML Card Preview:**", unsafe_allow_html=True)
-                st.markdown(result.html_card, unsafe_allow_html=True)
\ No newline at end of file
+            everyone = not selected_areas or "All (Global)" in selected_areas
+            target = None if everyone else selected_areas
+            context = custom_message if custom_message else custom_occasion
+            name = f"{custom_occasion} ({', '.join(target) if target else 'all'})"
+            st.session_state["global_campaign"] = _start_campaign(name, context, target, global_personalize)
+        _poll_campaign("global_campaign")
+
+    # --- Background Campaigns ---
+    with tab4:
+        campaigns_ui()
+
+def _start_campaign(name, occasion, areas, personalize):
+    """Hand a greeting run to the campaign runner; returns the campaign id.
+
+    Generation happens in the runner process, so a rerun or refresh of this page
+    doesn't lose anything. An existing campaign with the same name is reused.
+    """
+    existing = db.get_conn().execute("SELECT id FROM campaigns WHERE name=?", (name,)).fetchone()
+    if existing:
+        st.info(f"Campaign #{existing[0]} already exists for this; showing its progress.")
+        return existing[0]
+    recipients, skipped = suppression.select_recipients(areas)
+    if skipped:
+        st.warning(f"{sum(skipped.values())} users will be skipped: {suppression.describe(skipped)}.")
+    campaign_id = campaign_runner.create_campaign(name, occasion, areas, personalize)
+    st.success(f"Campaign #{campaign_id} created for {len(recipients)} users; the runner will pick it up.")
+    return campaign_id
+
+def _poll_campaign(state_key):
+    """Progress of the campaign this tab started (kept in session state across reruns)."""
+    campaign_id = st.session_state.get(state_key)
+    item = campaign_runner.get_campaign(campaign_id) if campaign_id else None
+    if item:
+        campaign_progress(item)
+        st.button("Refresh progress", key=f"{state_key}_refresh")
+
+def campaign_progress(item):
+    """Progress bar for one campaign row (see campaign_runner.list_campaigns); returns its counts."""
+    counts = campaign_runner.progress(item["id"])
+    total = counts["total"]
+    finished = total - counts.get("pending", 0)
+    st.markdown(f"**#{item['id']} {item['name']}** · {item['status']} · created {item['created_at']}")
+    st.progress(finished / total if total else 1.0,
+                text=f"{counts.get('queued', 0)} queued · {counts.get('skipped', 0)} skipped · "
+                     f"{counts.get('failed', 0)} failed · {counts.get('pending', 0)} pending of {total}")
+    return counts
+
+def campaigns_ui():
+    st.subheader("Background Campaigns")
+    st.caption("Campaigns run in a separate process (`python -m modules.campaign_runner`) and resume after restarts; this page only shows progress.")
+    areas = [row[0] for row in db.get_conn().execute(
+        "SELECT DISTINCT area FROM users WHERE area IS NOT NULL AND area != ''"
+    ).fetchall()]
+    with st.form("new_campaign_form"):
+        occasion = st.text_input("Occasion", value="New Year")
+        selected_areas = st.multiselect("Area(s) (leave empty for all users)", areas)
+        personalize = st.checkbox("Personalize each greeting with AI (one LLM call per user)")
+        if st.form_submit_button("Create Campaign"):
+            campaign_id = campaign_runner.create_campaign(
+                f"{occasion} ({', '.join(selected_areas) or 'all'})", occasion, selected_areas or None, personalize
+            )
+            st.success(f"Campaign #{campaign_id} created; the runner will pick it up.")
+
+    st.button("Refresh progress")
+    for item in campaign_runner.list_campaigns():
+        counts = campaign_progress(item)
+        if item["status"] in ("failed", "done") and counts.get("failed"):
+            if st.button("Retry failed recipients", key=f"resume_campaign_{item['id']}"):
+                campaign_runner.resume_campaign(item["id"])
+                st.rerun()
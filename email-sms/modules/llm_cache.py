@@ -0,0 +1,127 @@
+import hashlib
+import json
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from modules import db_pool
+
+# Kept apart from emails.db so cache writes never contend with app writes.
+CACHE_PATH = "llm_cache.db"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+# Trimming to max_entries runs every N writes rather than on each one.
+EVICT_EVERY = 50
+
+
+class SQLiteLRUCache(BaseCache):
+    """LangChain LLM cache in SQLite with a TTL and a size bound (least recently used entries go first).
+
+    Entries are keyed on the whitespace-normalized prompt plus LangChain's `llm_string`,
+    which already encodes the model name, temperature and other call parameters.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT,
+                    created_at REAL,
+                    last_access REAL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+
+    def _conn(self):
+        return db_pool.get_connection(self.path)
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(json.dumps([normalized, llm_string]).encode("utf-8")).hexdigest()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        response, created_at = row
+        with conn:
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                self._count(False)
+                return None
+            conn.execute("UPDATE llm_cache SET last_access=? WHERE key=?", (now, key))
+        self._count(True)
+        return loads(response)
+
+    def update(self, prompt, llm_string, return_val):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (self._key(prompt, llm_string), dumps(return_val), now, now)
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries and trim to `max_entries`, least recently used first."""
+        with self._conn() as conn:
+            if self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self, **kwargs):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def stats(self):
+        entries = self._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache instance shared by every LLM built in ai.get_llm()."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SQLiteLRUCache()
+        return _cache
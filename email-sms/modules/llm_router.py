@@ -0,0 +1,339 @@
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import RunnableLambda
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "mistral")
+# Ollama serves a handful of requests at once; more just queue inside it.
+MAX_CONCURRENCY = {
+    "ollama": int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "2")),
+    "openai": int(os.environ.get("OPENAI_MAX_CONCURRENCY", "8")),
+}
+# How long a call waits for a free local slot before going to the remote model.
+LOCAL_QUEUE_SECONDS = 1.0
+LOCAL_TIMEOUT_SECONDS = 60
+HEALTH_TTL_SECONDS = 30
+HEALTH_TIMEOUT_SECONDS = 1.0
+# Consecutive failures that take a backend out of rotation for COOLDOWN_SECONDS.
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 60
+
+# Task hints (see RoutingChatModel.for_task) for calls the local model shouldn't take:
+# the HTML greeting card, and fix-ups of output that already failed to parse.
+REMOTE_TASKS = frozenset({"greeting", "fixup"})
+# Other calls (today: email replies, which ai doesn't tag) run locally while the
+# prompt is at most this long.
+LOCAL_MAX_PROMPT_CHARS = 2000
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, float("inf"))
+
+
+class LatencyHistogram:
+    """Call latencies in fixed buckets (upper bounds in seconds)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th latency, or None before any calls."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {
+            "buckets": dict(zip(self.buckets, self.counts)),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class BackendBusy(Exception):
+    """No free concurrency slot on a backend within its queue timeout."""
+
+
+class Backend:
+    """Process-wide state for one backend: concurrency slots, health and latencies.
+
+    Shared by every router that uses the backend (see `backend()`), so the limits
+    hold across Streamlit sessions and background workers.
+    """
+
+    def __init__(self, name, max_concurrency, health_check=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.health_check = health_check
+        self.latency = LatencyHistogram()
+        self.calls = 0
+        self.failures = 0
+        self.busy = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._down_until = 0.0
+        self._checked_at = None
+        self._checking = False
+        self._healthy = True
+
+    def healthy(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._down_until:
+                return False
+            if self.health_check is None:
+                return True
+            fresh = self._checked_at is not None and now - self._checked_at < HEALTH_TTL_SECONDS
+            if fresh or self._checking:
+                return self._healthy  # one thread re-checks; the rest use the last result
+            self._checking = True
+        try:
+            healthy = self.health_check()
+        finally:
+            with self._lock:
+                self._checking = False
+        with self._lock:
+            self._healthy, self._checked_at = healthy, now
+        return healthy
+
+    def _acquire(self, queue_timeout):
+        if not self._slots.acquire(timeout=queue_timeout):
+            with self._lock:
+                self.busy += 1
+            raise BackendBusy(self.name)
+
+    def run(self, call, queue_timeout=None):
+        """`call()` in one of this backend's slots; BackendBusy if none frees up within `queue_timeout`."""
+        self._acquire(queue_timeout)
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception:
+            self._record(time.perf_counter() - start, failed=True)
+            raise
+        finally:
+            self._slots.release()
+        self._record(time.perf_counter() - start, failed=False)
+        return result
+
+    def stream(self, call, queue_timeout=None):
+        """Like `run` for a `call()` returning an iterator: yields its items and holds the slot until it ends."""
+        self._acquire(queue_timeout)
+        start = time.perf_counter()
+        try:
+            yield from call()
+        except Exception:
+            self._record(time.perf_counter() - start, failed=True)
+            raise
+        else:
+            self._record(time.perf_counter() - start, failed=False)
+        finally:
+            self._slots.release()
+
+    def _record(self, seconds, failed):
+        with self._lock:
+            self.calls += 1
+            self.latency.observe(seconds)
+            if not failed:
+                self._consecutive_failures = 0
+                return
+            self.failures += 1
+            self._consecutive_failures += 1
+            self._checked_at = None  # re-check health before the next call
+            if self._consecutive_failures >= FAILURE_THRESHOLD:
+                self._down_until = time.monotonic() + COOLDOWN_SECONDS
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "busy": self.busy,
+                "down": time.monotonic() < self._down_until or not self._healthy,
+                "latency": self.latency.snapshot(),
+            }
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def backend(name, health_check=None):
+    """The shared Backend called `name`, created on first use."""
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = Backend(name, MAX_CONCURRENCY.get(name, 4), health_check)
+        return _backends[name]
+
+
+def stats():
+    """{backend name: calls, failures, busy, down, latency histogram} for every backend used so far."""
+    with _backends_lock:
+        backends = list(_backends.values())
+    return {b.name: b.stats() for b in backends}
+
+
+def ollama_health_check(base_url, model):
+    """Health check for an Ollama server: reachable, and `model` has been pulled."""
+    def check():
+        try:
+            with urllib.request.urlopen(f"{base_url.rstrip('/')}/api/tags", timeout=HEALTH_TIMEOUT_SECONDS) as response:
+                tags = json.load(response)
+        except (OSError, ValueError):
+            return False
+        names = {m.get("name", "") for m in tags.get("models", [])}
+        return model in names or f"{model}:latest" in names
+    return check
+
+
+def _prompt_chars(prompt):
+    if isinstance(prompt, PromptValue):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, str):
+        return len(prompt)
+    return sum(len(m.content) if isinstance(m, BaseMessage) and isinstance(m.content, str) else len(str(m)) for m in prompt)
+
+
+class RoutingChatModel(BaseChatModel):
+    """Chat model that answers from a local Ollama model when it can and OpenAI otherwise.
+
+    Short prompts outside REMOTE_TASKS (in practice, email replies) go to the local
+    model; anything else, or anything the local model fails (unhealthy, saturated,
+    erroring, or output that doesn't fit the schema in structured mode), goes to `remote`.
+    """
+
+    local: BaseChatModel
+    remote: BaseChatModel
+    local_backend: str = "ollama"
+    remote_backend: str = "openai"
+    task: Optional[str] = None
+
+    @property
+    def _llm_type(self):
+        return "routing"
+
+    @property
+    def model_name(self):
+        # Structured-output decisions (ai.structured_output_method) follow the remote model.
+        return getattr(self.remote, "model_name", None)
+
+    def for_task(self, task):
+        """A router for one kind of call ("greeting", "fixup", ...; see REMOTE_TASKS)."""
+        return self.model_copy(update={"task": task})
+
+    def route(self, prompt):
+        """(Backend, model) pairs to try in order for `prompt`."""
+        remote = (backend(self.remote_backend), self.remote)
+        if self.task in REMOTE_TASKS:
+            return [remote]
+        if _prompt_chars(prompt) > LOCAL_MAX_PROMPT_CHARS:
+            return [remote]
+        return [(backend(self.local_backend), self.local), remote]
+
+    def _attempts(self, prompt):
+        """(Backend, model, queue timeout, last) for each candidate worth trying, in order."""
+        candidates = self.route(prompt)
+        for i, (target, model) in enumerate(candidates):
+            last = i == len(candidates) - 1
+            if last or target.healthy():
+                yield target, model, None if last else LOCAL_QUEUE_SECONDS, last
+
+    def _call(self, prompt, call):
+        for target, model, queue_timeout, last in self._attempts(prompt):
+            try:
+                return target.run(lambda: call(model), queue_timeout=queue_timeout)
+            except Exception:
+                if last:
+                    raise
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._call(messages, lambda model: model.invoke(messages, stop=stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Like _call, a backend failing before its first chunk falls through to the
+        # next; after that the error is raised. BaseChatModel.astream runs this too.
+        for target, model, queue_timeout, last in self._attempts(messages):
+            chunks = target.stream(lambda: model.stream(messages, stop=stop, **kwargs), queue_timeout=queue_timeout)
+            try:
+                first = next(chunks, None)
+            except Exception:
+                if last:
+                    raise
+                continue
+            if first is None:
+                return
+            for message in itertools.chain((first,), chunks):
+                chunk = ChatGenerationChunk(message=message)
+                if run_manager:
+                    run_manager.on_llm_new_token(message.content, chunk=chunk)
+                yield chunk
+            return
+
+    def bind_tools(self, tools, **kwargs):
+        raise NotImplementedError("Use with_structured_output; tool calls are bound per backend")
+
+    def with_structured_output(self, schema, *, include_raw=False, method=None, **kwargs):
+        """Structured output from whichever backend the call is routed to.
+
+        `method` applies to the remote model; the local one uses its own default
+        (JSON schema constrained decoding in Ollama).
+        """
+        remote_kwargs = {"method": method} if method else {}
+        structured = {
+            id(self.local): self.local.with_structured_output(schema, include_raw=include_raw, **kwargs),
+            id(self.remote): self.remote.with_structured_output(schema, include_raw=include_raw, **remote_kwargs, **kwargs),
+        }
+
+        def invoke(prompt, config):
+            def call(model):
+                result = structured[id(model)].invoke(prompt, config)
+                if result is None:
+                    raise OutputParserException(f"{type(model).__name__} returned no structured output")
+                return result
+            return self._call(prompt, call)
+
+        return RunnableLambda(invoke, name="RoutingStructuredOutput")
+
+
+def with_local_model(remote, cache=None, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL, temperature=0.7):
+    """Wrap `remote` in a RoutingChatModel with a local Ollama model in front.
+
+    Returns `remote` unchanged if langchain-ollama isn't installed.
+    """
+    try:
+        from langchain_ollama import ChatOllama
+    except ImportError:
+        return remote
+    backend("ollama", health_check=ollama_health_check(base_url, model))
+    local = ChatOllama(
+        model=model, base_url=base_url, temperature=temperature, cache=cache,
+        client_kwargs={"timeout": LOCAL_TIMEOUT_SECONDS},
+    )
+    return RoutingChatModel(local=local, remote=remote)
@@ -0,0 +1,124 @@
+import base64
+import html
+import io
+import os
+import string
+import threading
+import time
+import uuid
+from email.header import Header
+from email.utils import formataddr, getaddresses
+
+# How often a cached template's mtime is re-checked; sends in between never touch the disk.
+MTIME_CHECK_INTERVAL = 1.0
+
+
+class TemplateCache:
+    """Loads templates once as `string.Template` and reloads them only when the file's mtime changes.
+
+    Templates may use `${subject}` / `${body}` placeholders; anything else is left untouched.
+    """
+
+    def __init__(self, check_interval=MTIME_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._entries = {}  # path -> (mtime, last_checked, Template)
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        now = time.monotonic()
+        entry = self._entries.get(path)
+        if entry and now - entry[1] < self.check_interval:
+            return entry[2]
+        mtime = os.stat(path).st_mtime
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == mtime:
+                self._entries[path] = (mtime, now, entry[2])
+                return entry[2]
+            with open(path, "r", encoding="utf-8") as f:
+                template = string.Template(f.read())
+            self._entries[path] = (mtime, now, template)
+            return template
+
+
+templates = TemplateCache()
+_local = threading.local()
+
+
+def _buffer():
+    buf = getattr(_local, "buf", None)
+    if buf is None:
+        buf = _local.buf = io.BytesIO()
+    buf.seek(0)
+    buf.truncate()
+    return buf
+
+
+def _header(name, value, fold_newlines=False):
+    """Encode one text header value; a CR/LF would start a new header (e.g. an injected Bcc).
+
+    With `fold_newlines` (text like an LLM-written subject) line breaks become spaces;
+    otherwise they are rejected. Non-ASCII values are RFC 2047 encoded as a whole.
+    """
+    if "\r" in value or "\n" in value:
+        if not fold_newlines:
+            raise ValueError(f"Line break in {name} header: {value!r}")
+        value = " ".join(value.split())
+    if value.isascii():
+        return value.encode("ascii")
+    return Header(value, "utf-8").encode().encode("ascii")
+
+
+def _address_header(name, value):
+    """Encode an address list header such as To: only display names are RFC 2047 encoded.
+
+    Encoding the whole value would hide the addr-spec (`=?utf-8?b?...?=`), and Gmail
+    rejects a To without an address.
+    """
+    if "\r" in value or "\n" in value:
+        raise ValueError(f"Line break in {name} header: {value!r}")
+    addresses = [(display, addr) for display, addr in getaddresses([value]) if addr]
+    if not addresses:
+        raise ValueError(f"No address in {name} header: {value!r}")
+    formatted = ", ".join(formataddr(pair, charset="utf-8") for pair in addresses)
+    if not formatted.isascii():
+        raise ValueError(f"Non-ASCII address in {name} header: {value!r}")
+    return formatted.encode("ascii")
+
+
+def _write_part(buf, boundary, content_type, text):
+    buf.write(b"--" + boundary + b"\r\n")
+    buf.write(b"Content-Type: " + content_type + b"; charset=\"utf-8\"\r\n")
+    buf.write(b"Content-Transfer-Encoding: base64\r\n\r\n")
+    buf.write(base64.encodebytes(text.encode("utf-8")).replace(b"\n", b"\r\n"))
+
+
+def render_template(path, subject, body):
+    return templates.get(path).safe_substitute(subject=html.escape(subject), body=html.escape(body))
+
+
+def build_raw_message(to, subject, text=None, html_body=None):
+    """Return the Gmail API `raw` value (URL-safe base64 RFC 2822) for a text and/or HTML message.
+
+    With both parts the message is multipart/alternative, so clients show the HTML
+    card and fall back to the plain-text email.
+    """
+    buf = _buffer()
+    buf.write(b"MIME-Version: 1.0\r\n")
+    buf.write(b"To: " + _address_header("To", to) + b"\r\n")
+    buf.write(b"Subject: " + _header("Subject", subject, fold_newlines=True) + b"\r\n")
+    parts = [(b"text/plain", text), (b"text/html", html_body)]
+    parts = [(content_type, content) for content_type, content in parts if content]
+    if len(parts) == 1:
+        content_type, content = parts[0]
+        buf.write(b"Content-Type: " + content_type + b"; charset=\"utf-8\"\r\n")
+        buf.write(b"Content-Transfer-Encoding: base64\r\n\r\n")
+        buf.write(base64.encodebytes(content.encode("utf-8")).replace(b"\n", b"\r\n"))
+    else:
+        boundary = uuid.uuid4().hex.encode("ascii")
+        buf.write(b"Content-Type: multipart/alternative; boundary=\"" + boundary + b"\"\r\n\r\n")
+        for content_type, content in parts:
+            _write_part(buf, boundary, content_type, content)
+        buf.write(b"--" + boundary + b"--\r\n")
+    with buf.getbuffer() as view:
+        return base64.urlsafe_b64encode(view).decode("ascii")
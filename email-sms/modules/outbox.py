@@ -0,0 +1,207 @@
+import random
+import sys
+import threading
+import time
+
+from modules import db
+
+# Gmail allows 250 quota units per user per second and messages.send costs 100,
+# so 2 sends/sec with a burst of 2 stays safely under the per-user limit.
+SEND_RATE_PER_SECOND = 2.0
+SEND_BURST = 2
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_CAP_SECONDS = 300.0
+CLAIM_BATCH_SIZE = 50
+# A claimed ('sending') row holds a lease in next_attempt_at; if its sender dies
+# without finishing, any sender reclaims it once the lease expires. Well above the
+# CLAIM_BATCH_SIZE / SEND_RATE_PER_SECOND (25s) a batch normally takes.
+CLAIM_LEASE_SECONDS = 900
+# HTTP statuses worth retrying: rate limited or a transient server error.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `acquire()` blocks until a token is available."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def enqueue(campaign, recipient, subject, body, html=None):
+    """Queue one message; returns False if (campaign, recipient) was already queued or sent.
+
+    Recipients are compared normalized (db.email_key), so a differently-cased copy of an
+    address isn't greeted twice.
+    """
+    with db.get_conn() as conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO outbox (campaign, recipient, recipient_key, subject, body, html) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+            """,
+            (campaign, recipient, db.email_key(recipient), subject, body, html)
+        )
+    return cursor.rowcount == 1
+
+
+def status_counts(campaign=None):
+    query = "SELECT status, COUNT(*) FROM outbox"
+    params = ()
+    if campaign:
+        query += " WHERE campaign=?"
+        params = (campaign,)
+    return dict(db.get_conn().execute(query + " GROUP BY status", params).fetchall())
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempts))
+
+
+def _is_retryable(error):
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        # Network errors (timeouts, resets) have no HTTP status; assume transient.
+        return isinstance(error, (OSError, TimeoutError))
+    return int(status) in RETRYABLE_STATUSES
+
+
+def _claim_due(limit=CLAIM_BATCH_SIZE):
+    """Claim due pending rows, plus 'sending' rows whose lease ran out (their sender died)."""
+    now = time.time()
+    with db.get_conn() as conn:
+        return conn.execute(
+            """
+            UPDATE outbox SET status='sending', next_attempt_at=?
+            WHERE id IN (
+                SELECT id FROM outbox WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, recipient, subject, body, html, attempts
+            """,
+            (now + CLAIM_LEASE_SECONDS, now, limit)
+        ).fetchall()
+
+
+def _release(item_ids):
+    """Hand claimed but unsent rows back to the queue (sender stopping)."""
+    if not item_ids:
+        return
+    with db.get_conn() as conn:
+        conn.execute(
+            f"UPDATE outbox SET status='pending', next_attempt_at=0 "
+            f"WHERE status='sending' AND id IN ({','.join('?' for _ in item_ids)})",
+            list(item_ids)
+        )
+
+
+def _mark_sent(item_id, message_id):
+    with db.get_conn() as conn:
+        conn.execute(
+            "UPDATE outbox SET status='sent', message_id=?, sent_at=CURRENT_TIMESTAMP, last_error=NULL WHERE id=?",
+            (message_id, item_id)
+        )
+
+
+def _mark_failed(item_id, attempts, error, retry):
+    status = "pending" if retry and attempts < MAX_ATTEMPTS else "failed"
+    with db.get_conn() as conn:
+        conn.execute(
+            "UPDATE outbox SET status=?, attempts=?, next_attempt_at=?, last_error=? WHERE id=?",
+            (status, attempts, time.time() + backoff_delay(attempts), str(error), item_id)
+        )
+    return status
+
+
+def recover_stuck():
+    """Requeue every message left 'sending' now, without waiting for leases to expire.
+
+    Only safe when no other sender is running: their in-flight messages would be sent twice.
+    """
+    with db.get_conn() as conn:
+        conn.execute("UPDATE outbox SET status='pending' WHERE status='sending'")
+
+
+def _gmail_send(to, subject, body, html):
+    from modules import gmail
+    return gmail.send_email(to, subject, body, html)
+
+
+def send_pending(send_fn=None, bucket=None, stop_event=None, idle_exit=True, poll_interval=1.0):
+    """Drain the outbox, respecting the token bucket; returns a stats dict.
+
+    `send_fn(to, subject, body, html)` defaults to gmail.send_email. With `idle_exit`
+    the call returns once nothing is due; otherwise it polls until `stop_event` is set.
+    """
+    send_fn = send_fn or _gmail_send
+    bucket = bucket or TokenBucket(SEND_RATE_PER_SECOND, SEND_BURST)
+    stats = {"sent": 0, "retried": 0, "failed": 0}
+    start = time.perf_counter()
+    while not (stop_event and stop_event.is_set()):
+        batch = _claim_due()
+        if not batch:
+            if idle_exit:
+                break
+            time.sleep(poll_interval)
+            continue
+        unsent = [item[0] for item in batch]
+        try:
+            for item_id, recipient, subject, body, html, attempts in batch:
+                if stop_event and stop_event.is_set():
+                    break
+                bucket.acquire()
+                try:
+                    result = send_fn(recipient, subject, body, html)
+                except Exception as e:
+                    status = _mark_failed(item_id, attempts + 1, e, _is_retryable(e))
+                    stats["retried" if status == "pending" else "failed"] += 1
+                else:
+                    _mark_sent(item_id, (result or {}).get("id"))
+                    stats["sent"] += 1
+                unsent.remove(item_id)
+        finally:
+            _release(unsent)
+    elapsed = time.perf_counter() - start
+    stats["elapsed"] = elapsed
+    stats["messages_per_sec"] = stats["sent"] / elapsed if elapsed else 0.0
+    return stats
+
+
+_sender_thread = None
+_sender_lock = threading.Lock()
+
+
+def ensure_sender_thread():
+    """Start one background sender per process (used by the Streamlit app)."""
+    global _sender_thread
+    with _sender_lock:
+        if _sender_thread is None or not _sender_thread.is_alive():
+            _sender_thread = threading.Thread(
+                target=send_pending, kwargs={"idle_exit": False}, name="outbox-sender", daemon=True
+            )
+            _sender_thread.start()
+
+
+if __name__ == "__main__":
+    # Standalone sender: python -m modules.outbox   (from the email-sms directory)
+    db.init_db()
+    stats = send_pending(idle_exit="--once" in sys.argv)
+    print(f"sent={stats['sent']} retried={stats['retried']} failed={stats['failed']} "
+          f"({stats['messages_per_sec']:.2f} messages/sec)")
@@ -0,0 +1,50 @@
+import streamlit as st
+
+from modules import db, gmail_sync, outbox
+
+# Long-lived objects for the Streamlit app. st.cache_resource keeps one instance per
+# process, shared by every session and rerun, so reruns reuse warm HTTP connection
+# pools and prebuilt chains instead of rebuilding them per user or per click.
+# The Gmail service is already process-wide in gmail_client, and DB connections
+# are pooled per thread in db_pool. LangChain is imported on first use only, so
+# pages that never call the LLM don't pay for it.
+
+
+@st.cache_resource
+def _schema():
+    db.init_db()
+    return db.DB_PATH
+
+
+def database():
+    """Create/upgrade the schema once per process and make sure the background sync runs.
+
+    Not cached itself: ensure_sync_thread() is cheap and restarts the thread if it died.
+    """
+    path = _schema()
+    gmail_sync.ensure_sync_thread()
+    return path
+
+
+@st.cache_resource
+def llm():
+    """LLM client for one-off, interactive generations."""
+    from modules import ai
+    return ai.get_llm()
+
+
+@st.cache_resource
+def greeting_stream_chain():
+    from modules import ai
+    return ai.get_greeting_stream_chain(llm())
+
+
+@st.cache_resource
+def reply_chain():
+    from modules import ai
+    return ai.get_email_reply_chain(llm())
+
+
+def outbox_sender():
+    """Make sure the outbox sender thread runs (started, or restarted if it died)."""
+    outbox.ensure_sender_thread()
@@ -0,0 +1,137 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+from modules import db
+
+# Reasons stored in the suppressions table; "dnc", "no_email", "duplicate" and
+# "greeted_today" are derived from users and the outbox instead.
+STORED_REASONS = ("bounce", "unsubscribe")
+LABELS = {
+    "dnc": "do not contact",
+    "no_email": "no email address",
+    "duplicate": "duplicate address",
+    "bounce": "bounced",
+    "unsubscribe": "unsubscribed",
+    "greeted_today": "already greeted today",
+}
+# Shaped like `users` rows up to dnc, so campaign helpers can take them directly.
+USER_COLUMNS = "id, name, email, phone, birthday, area, dnc"
+
+
+def add(email, reason, source=None):
+    """Suppress an address for `reason` ('bounce' or 'unsubscribe'); returns False if it already was."""
+    if reason not in STORED_REASONS:
+        raise ValueError(f"Unknown suppression reason {reason!r}")
+    key = db.email_key(email)
+    if key is None:
+        raise ValueError(f"Not an email address: {email!r}")
+    with db.get_conn() as conn:
+        cursor = conn.execute(
+            "INSERT INTO suppressions (email_key, reason, source) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+            (key, reason, source)
+        )
+    return cursor.rowcount == 1
+
+
+def remove(email, reason=None):
+    query, params = "DELETE FROM suppressions WHERE email_key=?", (db.email_key(email),)
+    if reason:
+        query, params = query + " AND reason=?", params + (reason,)
+    with db.get_conn() as conn:
+        conn.execute(query, params)
+
+
+def counts():
+    return dict(db.get_conn().execute("SELECT reason, COUNT(*) FROM suppressions GROUP BY reason").fetchall())
+
+
+def _start_of_today_utc():
+    # outbox.created_at is CURRENT_TIMESTAMP (UTC); "today" is the local calendar day.
+    midnight = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class Suppressions:
+    """Every suppressed address for one campaign run, loaded once; lookups are dict hits.
+
+    Holds the suppressions table plus everyone already queued or sent today
+    (other than by `exclude_campaign`, so a resumed campaign doesn't skip its own recipients).
+    Addresses passed to `check` are remembered for the whole run, so a duplicate is caught
+    even when it turns up in a later chunk.
+    """
+
+    def __init__(self, reasons):
+        self._reasons = reasons
+        self._seen = set()
+
+    @classmethod
+    def load(cls, exclude_campaign=None):
+        conn = db.get_conn()
+        reasons = dict(conn.execute("SELECT email_key, reason FROM suppressions").fetchall())
+        greeted = conn.execute(
+            "SELECT DISTINCT recipient FROM outbox WHERE created_at >= ? AND status != 'failed' AND campaign != ?",
+            (_start_of_today_utc(), exclude_campaign or "")
+        )
+        for (recipient,) in greeted:
+            reasons.setdefault(db.email_key(recipient), "greeted_today")
+        return cls(reasons)
+
+    def __len__(self):
+        return len(self._reasons)
+
+    def reason(self, email):
+        """Why `email` must be skipped, or None if it may be contacted."""
+        key = db.email_key(email)
+        if key is None:
+            return "no_email"
+        return self._reasons.get(key)
+
+    def check(self, users):
+        """Yield (user, skip reason or None) for user rows (email at index 2); no per-row queries."""
+        for user in users:
+            key = db.email_key(user[2])
+            reason = "no_email" if key is None else self._reasons.get(key)
+            if reason is None and key in self._seen:
+                reason = "duplicate"
+            self._seen.add(key)
+            yield user, reason
+
+    def filter(self, users):
+        """Split user rows into (kept, Counter of skip reasons)."""
+        kept, skipped = [], Counter()
+        for user, reason in self.check(users):
+            if reason:
+                skipped[reason] += 1
+            else:
+                kept.append(user)
+        return kept, skipped
+
+
+def select_recipients(areas=None, suppressions=None, exclude_campaign=None):
+    """Users to greet in `areas` (None = everyone) and a Counter of who was skipped and why.
+
+    DNC and missing addresses are filtered in SQL; the rest against `suppressions`
+    (loaded here if not given). Nothing is generated or sent for skipped users.
+    """
+    where, params = "", ()
+    if areas:
+        where, params = f" AND area IN ({','.join('?' for _ in areas)})", tuple(areas)
+    conn = db.get_conn()
+    skipped = Counter(dict(conn.execute(
+        "SELECT CASE WHEN COALESCE(dnc, 0) != 0 THEN 'dnc' ELSE 'no_email' END, COUNT(*) FROM users "
+        f"WHERE (COALESCE(dnc, 0) != 0 OR email IS NULL OR email = ''){where} GROUP BY 1",
+        params
+    ).fetchall()))
+    candidates = conn.execute(
+        f"SELECT {USER_COLUMNS} FROM users WHERE COALESCE(dnc, 0) = 0 AND email IS NOT NULL AND email != ''{where}",
+        params
+    ).fetchall()
+    if suppressions is None:
+        suppressions = Suppressions.load(exclude_campaign)
+    recipients, suppressed = suppressions.filter(candidates)
+    return recipients, skipped + suppressed
+
+
+def describe(skipped):
+    """'3 do not contact, 1 bounced' for a Counter of skip reasons."""
+    return ", ".join(f"{n} {LABELS.get(reason, reason)}" for reason, n in skipped.most_common())
@@ -1,46 +1,125 @@
-import streamlit as st
 import sqlite3
+import streamlit as st
 import pandas as pd
-from modules import db
+from modules import db, suppression
+
+# Columns shown in the users table; birth_md and email_key are internal lookup keys.
+USER_COLUMNS = ("id", "name", "email", "phone", "birthday", "area", "dnc")
+# CSV rows parsed, validated and written per transaction; memory stays bounded by this.
+IMPORT_CHUNK_SIZE = 50_000
+# Rejected rows kept for the downloadable report (all of them are counted).
+MAX_REPORTED_ERRORS = 10_000
+EMAIL_PATTERN = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+PHONE_DIGITS = (7, 15)  # E.164 allows at most 15 digits
+CSV_COLUMNS = ["name", "email", "phone", "birthday", "area", "dnc"]
 
 def add_user_to_db(name, email, phone, birthday, area, dnc):
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO users (name, email, phone, birthday, area, dnc) VALUES (?, ?, ?, ?, ?, ?)",
-        (name, email, phone, birthday, area, int(dnc))
-    )
-    conn.commit()
-    conn.close()
+    with db.get_conn() as conn:
+        conn.execute(
+            "INSERT INTO users (name, email, phone, birthday, area, dnc, birth_md, email_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, email, phone, birthday, area, int(dnc), db.birth_md(birthday), db.email_key(email))
+        )
+    db.invalidate_counts("users")
 
 def update_user_in_db(user_id, name, email, phone, birthday, area, dnc):
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET name=?, email=?, phone=?, birthday=?, area=?, dnc=? WHERE id=?",
-        (name, email, phone, birthday, area, int(dnc), user_id)
-    )
-    conn.commit()
-    conn.close()
-
-def import_users_from_csv(csv_file):
-    df = pd.read_csv(csv_file)
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    for _, row in df.iterrows():
-        cursor.execute(
-            "INSERT INTO users (name, email, phone, birthday, area, dnc) VALUES (?, ?, ?, ?, ?, ?)",
-            (row.get("name"), row.get("email"), row.get("phone"), row.get("birthday"), row.get("area"), int(row.get("dnc", 0)))
+    with db.get_conn() as conn:
+        conn.execute(
+            "UPDATE users SET name=?, email=?, phone=?, birthday=?, area=?, dnc=?, birth_md=?, email_key=? WHERE id=?",
+            (name, email, phone, birthday, area, int(dnc), db.birth_md(birthday), db.email_key(email), user_id)
         )
-    conn.commit()
-    conn.close()
+
+def normalize_users(chunk):
+    """Vectorized cleanup of one CSV chunk.
+
+    Returns (rows, errors): rows are tuples ready for the users upsert, errors a
+    DataFrame of rejected rows with the CSV line number and the reason.
+    """
+    email = db.text_column(chunk, "email").str.lower()
+    phone = db.text_column(chunk, "phone")
+    birthday_text = db.text_column(chunk, "birthday")
+    dnc = db.text_column(chunk, "dnc").str.lower().isin(["1", "1.0", "true", "yes", "y"]).astype(int)
+
+    phone_digits = phone.str.replace(r"\D", "", regex=True)
+    phone_norm = phone_digits.where(~phone.str.startswith("+", na=False), "+" + phone_digits)
+    birthday = db.parse_dates(birthday_text)
+    birthday_iso = db.iso_dates(birthday)
+
+    reason = pd.Series(pd.NA, index=chunk.index, dtype="string")
+    digits = phone_digits.str.len()
+    bad_phone = phone.notna() & ((digits < PHONE_DIGITS[0]) | (digits > PHONE_DIGITS[1]))
+    reason = reason.mask(bad_phone.fillna(False).astype(bool), "invalid phone")
+    reason = reason.mask(birthday_text.notna() & birthday.isna(), "invalid birthday")
+    reason = reason.mask(~email.str.fullmatch(EMAIL_PATTERN, na=False).astype(bool), "invalid email")
+    reason = reason.mask(email.isna(), "missing email")
+    rejected = reason.notna()
+
+    errors = pd.DataFrame({
+        "line": chunk.index[rejected.to_numpy()] + 2,  # 1-based, after the header row
+        "email": db.text_column(chunk, "email")[rejected],
+        "reason": reason[rejected],
+    })
+    ok = ~rejected
+    clean = pd.DataFrame({
+        "name": db.text_column(chunk, "name")[ok],
+        "email": email[ok],
+        "phone": phone_norm[ok],
+        "birthday": birthday_iso[ok],
+        "area": db.text_column(chunk, "area")[ok],
+        "dnc": dnc[ok],
+        "birth_md": birthday_iso[ok].str.slice(5),
+    })
+    clean["email_key"] = clean["email"]
+    clean = clean.astype(object).where(clean.notna(), None)
+    return clean.itertuples(index=False, name=None), errors
+
+def import_users_from_csv(csv_file, chunksize=IMPORT_CHUNK_SIZE):
+    """Stream a users CSV into the database, upserting on the normalized email.
+
+    Re-importing a file updates the existing users instead of duplicating them;
+    an imported DNC flag is never cleared. Returns a stats dict with the
+    inserted/updated/rejected counts and `errors`, a DataFrame of rejected rows.
+    """
+    conn = db.get_conn()
+    stats = {"inserted": 0, "updated": 0, "rejected": 0}
+    reports = []
+    before = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    reader = pd.read_csv(
+        csv_file, chunksize=chunksize, dtype=str, keep_default_na=False,
+        usecols=lambda column: column in CSV_COLUMNS,
+    )
+    for chunk in reader:
+        rows, errors = normalize_users(chunk)
+        stats["rejected"] += len(errors)
+        if len(errors) and sum(map(len, reports)) < MAX_REPORTED_ERRORS:
+            reports.append(errors)
+        with conn:
+            written = conn.total_changes
+            conn.executemany(
+                """
+                INSERT INTO users (name, email, phone, birthday, area, dnc, birth_md, email_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(email_key) WHERE email_key IS NOT NULL DO UPDATE SET
+                    name=COALESCE(excluded.name, users.name),
+                    email=excluded.email,
+                    phone=COALESCE(excluded.phone, users.phone),
+                    birthday=COALESCE(excluded.birthday, users.birthday),
+                    birth_md=COALESCE(excluded.birth_md, users.birth_md),
+                    area=COALESCE(excluded.area, users.area),
+                    dnc=MAX(COALESCE(users.dnc, 0), excluded.dnc)
+                """,
+                rows
+            )
+            stats["updated"] += conn.total_changes - written
+    stats["inserted"] = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] - before
+    stats["updated"] -= stats["inserted"]
+    stats["errors"] = pd.concat(reports, ignore_index=True).head(MAX_REPORTED_ERRORS) if reports else pd.DataFrame(columns=["line", "email", "reason"])
+    db.invalidate_counts("users")
+    return stats
 
 def delete_user_from_db(user_id):
-    conn = sqlite3.connect(db.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    with db.get_conn() as conn:
+        conn.execute("DELETE FROM users WHERE id=?", (user_id,))
+    db.invalidate_counts("users")
 
 def user_manage_ui():
     col1, col2 = st.columns(2)
@@ -56,22 +135,52 @@ def user_manage_ui():
             dnc = st.checkbox("Do Not Contact")
             submitted = st.form_submit_button("Add User")
             if submitted:
-                add_user_to_db(name, email, phone, birthday.strftime('%Y-%m-%d'), area, dnc)
-                st.success("User added successfully.")
+                try:
+                    add_user_to_db(name, email, phone, birthday.strftime('%Y-%m-%d'), area, dnc)
+                    st.success("User added successfully.")
+                except sqlite3.IntegrityError:
+                    st.error(f"A user with the email {email} already exists.")
 
     with col2:
         st.header("Import Users via CSV")
         csv_file = st.file_uploader("Upload CSV", type="csv")
-        if csv_file is not None:
-            import_users_from_csv(csv_file)
-            st.success("Users imported successfully.")
+        st.caption("Columns: name, email, phone, birthday, area, dnc. Existing emails are updated, not duplicated.")
+        if csv_file is not None and st.button("Import Users"):
+            with st.spinner("Importing users..."):
+                stats = import_users_from_csv(csv_file)
+            st.success(f"Imported users: {stats['inserted']} new, {stats['updated']} updated.")
+            if stats["rejected"]:
+                st.warning(f"{stats['rejected']} rows were rejected.")
+                st.dataframe(stats["errors"].head(100))
+                st.download_button(
+                    "Download error report", stats["errors"].to_csv(index=False),
+                    file_name="user_import_errors.csv", mime="text/csv"
+                )
+
+    with st.expander("Suppression List (bounced / unsubscribed)"):
+        counts = suppression.counts()
+        st.caption(", ".join(f"{n} {suppression.LABELS[r]}" for r, n in counts.items()) or "No suppressed addresses.")
+        with st.form("suppression_form"):
+            address = st.text_input("Email")
+            reason = st.selectbox("Reason", suppression.STORED_REASONS, format_func=suppression.LABELS.get)
+            col_add, col_remove = st.columns(2)
+            if col_add.form_submit_button("Suppress"):
+                try:
+                    suppression.add(address, reason, source="manual")
+                    st.success(f"{address} will no longer be greeted.")
+                except ValueError as e:
+                    st.error(str(e))
+            if col_remove.form_submit_button("Remove"):
+                suppression.remove(address, reason)
+                st.success(f"{address} is no longer suppressed as {suppression.LABELS[reason]}.")
 
     st.subheader("All Users")
-    conn = sqlite3.connect(db.DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM users", conn)
-    conn.close()
+    df = db.fetch_page("users", USER_COLUMNS, db.page_cursor("users_cursors"))
+    st.dataframe(df)
+    db.pager_controls(
+        "users_cursors", len(df), int(df["id"].iloc[-1]) if len(df) else None, total=db.count_rows("users")
+    )
     if not df.empty:
-        st.dataframe(df)
 
         st.subheader("Update or Delete User")
         user_ids = df["id"].tolist()
@@ -91,9 +200,13 @@ def user_manage_ui():
             dnc = st.checkbox("Do Not Contact", value=bool(user_row["dnc"]))
             update_submitted = st.form_submit_button("Update User")
             if update_submitted:
-                update_user_in_db(selected_user_id, name, email, phone, birthday, area, dnc)
-                st.success("User updated successfully.")
-                st.experimental_rerun()
+                try:
+                    update_user_in_db(selected_user_id, name, email, phone, birthday, area, dnc)
+                except sqlite3.IntegrityError:
+                    st.error(f"Another user already has the email {email}.")
+                else:
+                    st.success("User updated successfully.")
+                    st.experimental_rerun()
 
         # Delete option
         if st.button("Delete Selected User"):   
@@ -1,12 +1,22 @@
 from flask import Flask, request, jsonify
+import base64
 import hmac
 import hashlib
+import json
 import os
+import sys
+
+if __name__ == "__main__":
+    # Allow `python modules/webhook.py` from the email-sms directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules import db, webhook_queue
 
 app = Flask(__name__)
 
 # Optional: Set a secret for webhook verification
 WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "changeme")
+WORKER_COUNT = int(os.environ.get("WEBHOOK_WORKERS", "2"))
 
 @app.route("/gmail-webhook", methods=["POST"])
 def gmail_webhook():
@@ -15,13 +25,24 @@ def gmail_webhook():
     # if not verify_signature(request.data, signature):
     #     return "Invalid signature", 403
 
-    data = request.get_json()
-    # Process the webhook data (e.g., Gmail push notification)
-    # You can trigger your auto-reply logic here or flag the DB for Streamlit to process
+    data = request.get_json(silent=True) or {}
+    notification = decode_pubsub_message(data)
+    if notification is None:
+        # Ack anyway: a malformed push would otherwise be retried forever
+        print("Ignoring webhook without a Gmail notification:", data)
+        return jsonify({"status": "ignored"}), 200
+
+    # Only record the notification; fetch, AI reply and send happen in the worker pool
+    webhook_queue.enqueue(notification["emailAddress"], notification["historyId"])
+    return jsonify({"status": "queued"}), 200
 
-    # Example: Just print and acknowledge
-    print("Received webhook:", data)
-    return jsonify({"status": "received"}), 200
+def decode_pubsub_message(data):
+    """Return the Gmail notification ({"emailAddress", "historyId"}) from a Pub/Sub push body."""
+    try:
+        notification = json.loads(base64.b64decode(data["message"]["data"]))
+        return {"emailAddress": notification["emailAddress"], "historyId": int(notification["historyId"])}
+    except (KeyError, TypeError, ValueError):
+        return None
 
 # Optional: Signature verification function
 def verify_signature(payload, signature):
@@ -30,4 +51,6 @@ def verify_signature(payload, signature):
     return hmac.compare_digest(expected, signature)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
\ No newline at end of file
+    db.init_db()
+    webhook_queue.start_workers(WORKER_COUNT)
+    app.run(host="0.0.0.0", port=8080, threaded=True)
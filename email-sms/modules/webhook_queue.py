@@ -0,0 +1,167 @@
+import json
+import sqlite3
+import threading
+import traceback
+from datetime import datetime
+
+from modules import ai, db, gmail, gmail_sync
+
+MAX_ATTEMPTS = 5
+# Failed replies to one email before the workers stop trying it (it stays unreplied
+# for the Auto-Reply page).
+MAX_REPLY_ATTEMPTS = 3
+# sync_state key: emails received from this time on get auto-replies. Set when the
+# workers first start, so an existing backlog isn't answered all at once.
+AUTO_REPLY_SINCE_KEY = "auto_reply_since"
+# Workers also poll, so jobs enqueued by another process are picked up.
+POLL_INTERVAL = 5.0
+
+_wakeup = threading.Event()
+
+
+def enqueue(mailbox, history_id):
+    """Queue a sync for `mailbox`; a burst of notifications collapses into one pending job.
+
+    Only jobs that haven't synced yet are merged into: a job retrying its checkpointed
+    message_ids is left alone, so those replies are still sent.
+    """
+    with db.get_conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO webhook_jobs (mailbox, history_id) VALUES (?, ?)
+            ON CONFLICT(mailbox) WHERE status='pending' AND message_ids IS NULL
+            DO UPDATE SET history_id=MAX(history_id, excluded.history_id), updated_at=CURRENT_TIMESTAMP
+            """,
+            (mailbox, int(history_id))
+        )
+    _wakeup.set()
+
+
+def claim_job():
+    """Mark the oldest pending job as running and return (id, mailbox, history_id, message_ids).
+
+    A mailbox that already has a running job is skipped, so the same inbox is never synced twice at once.
+    """
+    with db.get_conn() as conn:
+        rows = conn.execute(
+            """
+            UPDATE webhook_jobs SET status='running', attempts=attempts+1, updated_at=CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM webhook_jobs
+                WHERE status='pending'
+                  AND mailbox NOT IN (SELECT mailbox FROM webhook_jobs WHERE status='running')
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, mailbox, history_id, message_ids
+            """
+        ).fetchall()
+    return rows[0] if rows else None
+
+
+def complete_job(job_id):
+    with db.get_conn() as conn:
+        conn.execute("UPDATE webhook_jobs SET status='done', updated_at=CURRENT_TIMESTAMP WHERE id=?", (job_id,))
+
+
+def fail_job(job_id, error):
+    conn = db.get_conn()
+    try:
+        with conn:
+            conn.execute(
+                """
+                UPDATE webhook_jobs
+                SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    last_error=?, updated_at=CURRENT_TIMESTAMP
+                WHERE id=?
+                """,
+                (MAX_ATTEMPTS, error, job_id)
+            )
+    except sqlite3.IntegrityError:
+        # Only a job that never checkpointed its message_ids can conflict (see
+        # idx_webhook_jobs_pending_sync): the newer pending job's sync covers it.
+        with conn:
+            conn.execute(
+                "UPDATE webhook_jobs SET status='superseded', last_error=?, updated_at=CURRENT_TIMESTAMP WHERE id=?",
+                (error, job_id)
+            )
+
+
+def recover_running_jobs():
+    """Requeue jobs left 'running' by a crashed worker process.
+
+    Jobs that already checkpointed message_ids always go back to pending; unsynced
+    ones are superseded if a newer unsynced job is pending, since its sync covers them.
+    """
+    with db.get_conn() as conn:
+        conn.execute("UPDATE OR IGNORE webhook_jobs SET status='pending' WHERE status='running'")
+        conn.execute("UPDATE webhook_jobs SET status='superseded' WHERE status='running'")
+
+
+def _checkpoint_message_ids(job_id, message_ids):
+    with db.get_conn() as conn:
+        conn.execute("UPDATE webhook_jobs SET message_ids=? WHERE id=?", (json.dumps(message_ids), job_id))
+
+
+def _email_text(email):
+    """Text to answer: synced rows only hold metadata, so fetch the full message."""
+    body = gmail.get_email_content(gmail.get_email_detail(email["id"]))
+    if not body or body.startswith("(No content found"):
+        body = email["snippet"]
+    return body
+
+
+def process_job(job, llm):
+    job_id, mailbox, history_id, message_ids = job
+    if message_ids is None:
+        # The app's background sync may already have stored the new messages (and
+        # advanced the historyId), in which case this sync returns nothing. So reply to
+        # every unreplied email since auto-reply started, whoever synced it, and
+        # checkpoint that list: a retry answers the same messages.
+        gmail_sync.sync_mailbox()
+        message_ids = db.get_unreplied_email_ids(db.get_sync_state(AUTO_REPLY_SINCE_KEY), MAX_REPLY_ATTEMPTS)
+        _checkpoint_message_ids(job_id, message_ids)
+    else:
+        message_ids = json.loads(message_ids)
+    emails = [e for e in db.get_unreplied_emails_by_ids(message_ids) if (e["reply_attempts"] or 0) < MAX_REPLY_ATTEMPTS]
+    # A failing email is recorded and skipped so the rest still get their replies;
+    # the job only fails (and is retried) when nothing could be sent.
+    errors = []
+    for email in emails:
+        try:
+            reply = ai.generate_ai_reply(llm, email["subject"], _email_text(email))
+            gmail.send_reply(email["sender"], reply.subject, reply.reply)
+        except Exception as e:
+            traceback.print_exc()
+            db.record_reply_failure(email["id"], str(e))
+            errors.append(f"{email['id']}: {e}")
+            continue
+        db.mark_email_replied(email["id"], reply.reply)
+    if emails and len(errors) == len(emails):
+        raise RuntimeError(f"All {len(emails)} replies failed; last error {errors[-1]}")
+
+
+def worker_loop(stop_event):
+    llm = ai.get_llm()
+    while not stop_event.is_set():
+        job = claim_job()
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        try:
+            process_job(job, llm)
+            complete_job(job[0])
+        except Exception as e:
+            traceback.print_exc()
+            fail_job(job[0], str(e))
+
+
+def start_workers(count=2):
+    """Start `count` daemon worker threads; set the returned event to stop them."""
+    if db.get_sync_state(AUTO_REPLY_SINCE_KEY) is None:
+        db.set_sync_state(AUTO_REPLY_SINCE_KEY, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    recover_running_jobs()
+    stop_event = threading.Event()
+    for i in range(count):
+        threading.Thread(target=worker_loop, args=(stop_event,), name=f"webhook-worker-{i}", daemon=True).start()
+    return stop_event